@@ -0,0 +1,27 @@
+"""
+Атомарная запись файлов log_analyzer: отчеты и агрегаты появляются под своим именем
+только целиком записанными
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_open(path, mode="w", **kwargs):
+    """
+    Открывает временный файл рядом с path и по успешному закрытию атомарно переименовывает его в path,
+    при ошибке временный файл удаляется
+    """
+
+    with tempfile.NamedTemporaryFile(mode, dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp",
+                                     delete=False, **kwargs) as file:
+        try:
+            yield file
+        except BaseException:
+            file.close()
+            os.unlink(file.name)
+            raise
+    # временный файл создается с правами 0600, а отчеты должны читаться, как и раньше
+    os.chmod(file.name, 0o644)
+    os.replace(file.name, path)
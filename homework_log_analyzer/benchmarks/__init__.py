@@ -0,0 +1,4 @@
+"""
+Бенчмарки log_analyzer, запускаются из каталога homework_log_analyzer:
+python3 -m benchmarks.<имя модуля>
+"""
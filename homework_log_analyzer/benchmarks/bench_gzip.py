@@ -0,0 +1,73 @@
+"""
+Скорость чтения gzip-лога (MB/s распакованных данных): gzip.open в текстовом режиме
+против блочной распаковки zlib и внешней команды, без разбора и с разбором строк
+"""
+import argparse
+import gzip
+import os
+import shutil
+import tempfile
+import time
+
+import log_analyzer
+from benchmarks.synthetic import generate_lines
+
+
+def read_text(path):
+    """
+    Исходный путь чтения: gzip.open(..., "rt") и process_line
+    """
+
+    with gzip.open(path, "rt", encoding="utf-8") as lines:
+        yield from log_analyzer.parse_lines(lines)
+
+
+def measure(name, func, size):
+    """
+    Печатает скорость прохода func() по данным размером size байт
+    """
+
+    start = time.perf_counter()
+    for _ in func():
+        pass
+    elapsed = time.perf_counter() - start
+    print(f"{name:28} {size / elapsed / 2 ** 20:8.1f} MB/s")
+
+
+def main():
+    """
+    Запускает сравнение способов чтения
+    """
+
+    parser = argparse.ArgumentParser(description="gzip ingestion benchmark")
+    parser.add_argument("--path", help="gzip log, by default a synthetic one is generated")
+    parser.add_argument("--lines", type=int, default=500000)
+    args = parser.parse_args()
+
+    tmp_dir = None
+    path = args.path
+    if not path:
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, "nginx-access-ui.log-20170629.gz")
+        with gzip.open(path, "wt", encoding="utf-8") as file:
+            file.writelines(generate_lines(args.lines))
+    try:
+        size = sum(len(block) for block in log_analyzer.read_gzip_blocks(path))
+        print(f"{path}: {os.path.getsize(path) / 2 ** 20:.1f} MB compressed, {size / 2 ** 20:.1f} MB plain")
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            measure("gzip.open text lines", lambda: file, size)
+        measure("zlib blocks, bytes lines", lambda: log_analyzer.split_lines(log_analyzer.read_gzip_blocks(path)),
+                size)
+        measure("gzip.open + process_line", lambda: read_text(path), size)
+        measure("zlib + process_line_bytes", lambda: log_analyzer.read_lines(path), size)
+        for command in (["zcat"], ["pigz", "-dc"]):
+            if shutil.which(command[0]):
+                measure(f"{' '.join(command)} + process_line_bytes",
+                        lambda command=command: log_analyzer.read_lines(path, command), size)
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
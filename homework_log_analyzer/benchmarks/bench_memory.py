@@ -0,0 +1,56 @@
+"""
+Память агрегатов get_report_data, время расчета статистики и погрешность time_med
+для хранилищ list, array('d') и QuantileSketch на синтетическом логе
+"""
+import argparse
+import time
+import tracemalloc
+
+import log_analyzer
+from benchmarks.synthetic import generate_lines
+
+
+def measure(timings_factory, lines, urls):
+    """
+    Возвращает пиковую память агрегации (байт), время расчета статистики (с) и медианы по url
+    """
+
+    tracemalloc.start()
+    parsed_lines = log_analyzer.parse_lines(generate_lines(lines, urls))
+    report_data = log_analyzer.aggregate(parsed_lines, timings_factory)[2]
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    start = time.perf_counter()
+    medians = {url: log_analyzer.time_stats(timings)[3] for url, timings in report_data.items()}
+    return peak, time.perf_counter() - start, medians
+
+
+def main():
+    """
+    Сравнивает режимы агрегации
+    """
+
+    parser = argparse.ArgumentParser(description="aggregation memory benchmark")
+    parser.add_argument("--lines", type=int, default=1000000)
+    parser.add_argument("--urls", type=int, default=1000)
+    parser.add_argument("--accuracy", type=float, default=0.01)
+    args = parser.parse_args()
+
+    factories = {
+        "exact (list)": list,
+        "exact (array)": log_analyzer.make_timings_factory({"AGGREGATION": "exact"}),
+        "approximate": log_analyzer.make_timings_factory(
+            {"AGGREGATION": "approximate", "SKETCH_ACCURACY": args.accuracy}
+        ),
+    }
+    results = {name: measure(factory, args.lines, args.urls) for name, factory in factories.items()}
+    exact_medians = results["exact (list)"][2]
+    print(f"lines: {args.lines}, urls: {len(exact_medians)}, numpy: {log_analyzer.numpy is not None}")
+    for name, (peak, stats_time, medians) in results.items():
+        max_error = max(abs(medians[url] - value) / value for url, value in exact_medians.items() if value)
+        print(f"{name:14} {peak / 2 ** 20:8.1f} MiB, stats {stats_time:6.3f} s, "
+              f"max relative time_med error {max_error:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Скорость разбора plain-лога (MB/s): построчное текстовое чтение и process_line
+против разбора bytes прямо в mmap
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import log_analyzer
+from benchmarks.synthetic import generate_lines
+
+
+def read_text(path):
+    """
+    Исходный путь чтения: open(..., "rt") и process_line
+    """
+
+    with open(path, "rt", encoding="utf-8") as lines:
+        yield from log_analyzer.parse_lines(lines)
+
+
+def main():
+    """
+    Запускает сравнение способов чтения
+    """
+
+    parser = argparse.ArgumentParser(description="plain log ingestion benchmark")
+    parser.add_argument("--path", help="plain log, by default a synthetic one is generated")
+    parser.add_argument("--lines", type=int, default=500000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tmp_dir = None
+    path = args.path
+    if not path:
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, "nginx-access-ui.log-20170629")
+        with open(path, "w", encoding="utf-8") as file:
+            file.writelines(generate_lines(args.lines))
+    try:
+        size = os.path.getsize(path)
+        readers = {"text + process_line": read_text, "mmap + bytes regex": log_analyzer.read_chunk}
+        best = dict.fromkeys(readers, float("inf"))
+        # прогоны чередуются, берется лучший, чтобы сгладить влияние кэша и соседних процессов
+        for _ in range(args.repeat):
+            for name, reader in readers.items():
+                start = time.perf_counter()
+                for _ in reader(path):
+                    pass
+                best[name] = min(best[name], time.perf_counter() - start)
+        for name, elapsed in best.items():
+            print(f"{name:24} {size / elapsed / 2 ** 20:8.1f} MB/s")
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Микробенчмарк разбора строк лога: lines/sec до и после предкомпиляции формата
+"""
+import argparse
+import re
+import time
+
+import log_analyzer
+
+SAMPLE_LINES = [
+    '1.99.174.176 3b81f63526fa8  - [29/Jun/2017:05:40:45 +0300] '
+    '"GET /api/1/photogenic_banners/list/?server_name=WIN7RB1 HTTP/1.1" 200 12 "-" '
+    '"Python-urllib/2.7" "-" "1498704044-32900793-4708-9803879" "-" 0.127\n',
+    '1.196.116.32 -  - [29/Jun/2017:03:50:22 +0300] '
+    '"GET /api/v2/banner/25019354 HTTP/1.1" 200 927 "-" '
+    '"Lynx/2.8.8dev.9 libwww-FM/2.14 SSL-MM/1.4.1 GNUTLS/2.10.5" "-" '
+    '"1498697422-2190034393-4708-9752759" "dc7161be3" 0.390\n',
+    '1.126.153.80 -  - [29/Jun/2017:04:46:00 +0300] '
+    '"GET /agency/outgoings_stats/?date1=28-06-2017&date2=28-06-2017&date_type=day&do=1&rt=banner&'
+    'oi=25754435&as_json=1 HTTP/1.1" 200 217 "-" "-" "-" '
+    '"1498700760-48424485-4709-9957635" "1835ae0f17f" 0.068\n',
+    '1.202.56.176 -  - [29/Jun/2017:03:59:15 +0300] "0" 400 166 "-" "-" "-" "-" "-" 0.000\n',
+]
+
+
+def legacy_process_line(line):
+    """
+    Исходная реализация process_line: шаблон и регулярки собираются на каждой строке
+    """
+
+    log_template = '$remote_addr $remote_user  $http_x_real_ip [$time_local] "$request" ' \
+                   '$status $body_bytes_sent "$http_referer" "$http_user_agent" ' \
+                   '"$http_x_forwarded_for" "$http_X_REQUEST_ID" "$http_X_RB_USER" $request_time'
+
+    mask = re.sub(r'([\[\]\"{}])', r'\\\1', log_template)
+    pattern = re.sub(r'\$(\w+)', r'(?P<\1>.+)', mask)
+    search_matches = re.search(pattern, line)
+    request_time = search_matches['request_time']
+    request = search_matches['request']
+
+    url_pattern = re.compile(r'((GET|POST) (?P<url>.+) (http/\d\.\d))', re.I)
+    url_search = re.search(url_pattern, request)
+    url = url_search['url'] if url_search else request
+    return url, request_time
+
+
+def measure(func, lines):
+    """
+    Возвращает скорость разбора в строках в секунду
+    """
+
+    start = time.perf_counter()
+    for line in lines:
+        func(line)
+    return len(lines) / (time.perf_counter() - start)
+
+
+def main():
+    """
+    Запускает сравнение реализаций
+    """
+
+    parser = argparse.ArgumentParser(description="process_line benchmark")
+    parser.add_argument("--lines", type=int, default=100000)
+    args = parser.parse_args()
+    lines = (SAMPLE_LINES * (args.lines // len(SAMPLE_LINES) + 1))[:args.lines]
+    for line in SAMPLE_LINES:
+        assert legacy_process_line(line) == log_analyzer.process_line(line)
+    before = measure(legacy_process_line, lines)
+    after = measure(log_analyzer.process_line, lines)
+    print(f"legacy:      {before:12.0f} lines/sec")
+    print(f"precompiled: {after:12.0f} lines/sec")
+    print(f"speedup:     {after / before:12.1f}x")
+
+
+if __name__ == "__main__":
+    main()
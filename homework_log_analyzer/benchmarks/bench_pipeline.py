@@ -0,0 +1,102 @@
+"""
+Бенчмарк стадий log_analyzer на синтетическом логе: get_report_data, create_report и render_report
+замеряются отдельно, результат (lines/sec, пиковый RSS, время стадий) печатается в JSON,
+чтобы сравнивать прогоны и ловить регрессии
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import log_analyzer
+from benchmarks.synthetic import write_log
+
+
+def peak_rss_mb():
+    """
+    Возвращает пиковый RSS процесса и его дочерних процессов-воркеров в MiB
+    """
+
+    # ru_maxrss в Linux в килобайтах, в macOS в байтах
+    scale = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return round(max(own, children) / 2 ** 20, 1)
+
+
+def run(path, cfg):
+    """
+    Прогоняет стадии на логе path и возвращает словарь с результатами
+    """
+
+    stages = {}
+    start = time.perf_counter()
+    total_count, total_time, report_data = log_analyzer.get_report_data(path, cfg)
+    stages["get_report_data"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    report = list(log_analyzer.create_report(total_count, total_time, report_data, cfg["REPORT_SIZE"]))
+    stages["create_report"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    log_analyzer.render_report(cfg, "bench", report)
+    stages["render_report"] = time.perf_counter() - start
+
+    return {
+        "lines": total_count,
+        "bytes": os.path.getsize(path),
+        "urls": len(report_data),
+        "aggregation": cfg["AGGREGATION"],
+        "workers": cfg["WORKERS"],
+        "gzip": path.endswith(".gz"),
+        "lines_per_sec": round(total_count / stages["get_report_data"]),
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": {name: round(seconds, 4) for name, seconds in stages.items()},
+        "total_seconds": round(sum(stages.values()), 4),
+    }
+
+
+def main():
+    """
+    Генерирует лог (если не передан --path) и печатает результаты в JSON
+    """
+
+    parser = argparse.ArgumentParser(description="log_analyzer pipeline benchmark")
+    parser.add_argument("--path", help="existing log, by default a synthetic one is generated")
+    parser.add_argument("--lines", type=int, default=1000000)
+    parser.add_argument("--urls", type=int, default=10000, help="url cardinality of the synthetic log")
+    parser.add_argument("--gzip", action="store_true", help="generate a gzip log")
+    parser.add_argument("--aggregation", choices=("exact", "approximate"), default="exact")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--report-size", type=int, default=1000)
+    parser.add_argument("--output", help="append the JSON result as a line to this file")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = args.path
+        if not path:
+            path = os.path.join(tmp_dir, "nginx-access-ui.log-20170629" + (".gz" if args.gzip else ""))
+            write_log(path, args.lines, args.urls, args.gzip)
+        cfg = {
+            **log_analyzer.default_config,
+            "REPORT_DIR": tmp_dir,
+            "REPORT_SIZE": args.report_size,
+            "AGGREGATION": args.aggregation,
+            "WORKERS": args.workers,
+        }
+        result = json.dumps(run(path, cfg))
+    finally:
+        shutil.rmtree(tmp_dir)
+    print(result)
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as file:
+            file.write(result + "\n")
+
+
+if __name__ == "__main__":
+    main()
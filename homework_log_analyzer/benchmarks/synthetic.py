@@ -0,0 +1,85 @@
+"""
+Генератор синтетических логов nginx в формате log_analyzer.LOG_TEMPLATE
+
+Запуск: python3 -m benchmarks.synthetic --lines 1000000 --urls 10000 [--gzip] --out log/nginx-access-ui.log-20170629
+"""
+import argparse
+import gzip
+import random
+
+LINE_TEMPLATE = '{ip} -  - [{day}/Jun/2017:{hour:02d}:{minute:02d}:{second:02d} +0300] ' \
+                '"{method} {url} HTTP/1.1" {status} {size} "-" "{agent}" "-" ' \
+                '"{request_id}" "-" {request_time:.3f}\n'
+BAD_REQUEST_TEMPLATE = '{ip} -  - [{day}/Jun/2017:{hour:02d}:{minute:02d}:{second:02d} +0300] ' \
+                       '"0" 400 166 "-" "-" "-" "-" "-" 0.000\n'
+URL_TEMPLATES = (
+    "/api/v2/banner/{id}",
+    "/api/v2/group/{id}/statistic/sites/?date_type=day&date_from=2017-06-28&date_to=2017-06-28",
+    "/api/1/photogenic_banners/list/?server_name=WIN7RB{id}",
+    "/export/appinstall_raw/2017-06-{id}/",
+    "/agency/outgoings_stats/?date1=28-06-2017&date2=28-06-2017&date_type=day&do=1&rt=banner&oi={id}&as_json=1",
+)
+AGENTS = ("Lynx/2.8.8dev.9 libwww-FM/2.14 SSL-MM/1.4.1 GNUTLS/2.10.5", "Python-urllib/2.7", "Configovod", "-")
+
+
+def generate_lines(count, urls=1000, seed=0, bad_requests=0.001, day=29):
+    """
+    Генерирует count строк лога за день day с urls различными url. Популярность url
+    убывает по степенному закону, время запросов распределено логнормально,
+    доля bad_requests строк - запросы "0" без метода и url, как в реальных логах
+    """
+
+    rnd = random.Random(seed)
+    for number in range(count):
+        seconds = number * 86400 // max(count, 1)
+        fields = {
+            "ip": f"1.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}",
+            "day": day,
+            "hour": seconds // 3600,
+            "minute": seconds // 60 % 60,
+            "second": seconds % 60,
+        }
+        if rnd.random() < bad_requests:
+            yield BAD_REQUEST_TEMPLATE.format(**fields)
+            continue
+        url_number = int(rnd.paretovariate(1.2)) % urls
+        yield LINE_TEMPLATE.format(
+            method="POST" if rnd.random() < 0.1 else "GET",
+            url=URL_TEMPLATES[url_number % len(URL_TEMPLATES)].format(id=url_number),
+            status=200,
+            size=rnd.randint(10, 10000),
+            agent=rnd.choice(AGENTS),
+            request_id=f"{rnd.getrandbits(32)}-{number}",
+            # у каждого url свое типичное время ответа
+            request_time=rnd.lognormvariate(-3 + url_number % 7 * 0.5, 1),
+            **fields,
+        )
+
+
+def write_log(path, count, urls=1000, compress=False, seed=0):
+    """
+    Записывает синтетический лог в path, в gzip если compress
+    """
+
+    open_flag = gzip.open if compress else open
+    with open_flag(path, "wt", encoding="utf-8") as file:
+        file.writelines(generate_lines(count, urls, seed))
+
+
+def main():
+    """
+    Записывает синтетический лог по параметрам командной строки
+    """
+
+    parser = argparse.ArgumentParser(description="synthetic nginx log generator")
+    parser.add_argument("--lines", type=int, default=1000000)
+    parser.add_argument("--urls", type=int, default=1000, help="url cardinality")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+    write_log(args.out, args.lines, args.urls, args.gzip, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Компактный колоночный бинарный формат для агрегатов и отчетов log_analyzer.
+
+Файл: MAGIC, данные колонок подряд, JSON-футер с описанием колонок, длина футера (8 байт) и MAGIC.
+Числовые колонки хранятся как сырые array(typecode), строковые - как utf-8 байты
+и массив длин строк. Футер в конце позволяет писать колонки потоково, частями.
+"""
+import json
+import os
+import struct
+import sys
+from array import array
+
+from atomicfile import atomic_open
+
+MAGIC = b"LACOL1\n"
+FOOTER_SIZE = struct.Struct("<Q")
+STR = "str"
+
+
+class ColumnarFormatError(Exception):
+    """
+    Файл не является колоночным файлом log_analyzer
+    """
+
+
+def write_columns(path, columns, meta=None):
+    """
+    Атомарно записывает колонки в файл.
+    columns - список (имя, typecode, части), где typecode - код array или "str",
+    части - итерируемый набор последовательностей значений колонки
+    """
+
+    descriptions = []
+    with atomic_open(path, "wb") as file:
+        file.write(MAGIC)
+        for name, typecode, chunks in columns:
+            description = {"name": name, "type": typecode, "offset": file.tell()}
+            if typecode == STR:
+                lengths = array("q")
+                for chunk in chunks:
+                    encoded = [value.encode("utf-8") for value in chunk]
+                    lengths.extend(len(value) for value in encoded)
+                    file.write(b"".join(encoded))
+                description["lengths_offset"] = file.tell()
+                lengths.tofile(file)
+                description["length"] = len(lengths)
+            else:
+                length = 0
+                for chunk in chunks:
+                    chunk = chunk if isinstance(chunk, array) and chunk.typecode == typecode else array(typecode, chunk)
+                    chunk.tofile(file)
+                    length += len(chunk)
+                description["length"] = length
+            descriptions.append(description)
+        footer = json.dumps({"byteorder": sys.byteorder, "meta": meta or {}, "columns": descriptions}).encode()
+        file.write(footer)
+        file.write(FOOTER_SIZE.pack(len(footer)))
+        file.write(MAGIC)
+
+
+def read_meta(path):
+    """
+    Читает только метаданные файла, не загружая колонки
+    """
+
+    with open(path, "rb") as file:
+        return _read_footer(file, path)["meta"]
+
+
+def read_columns(path):
+    """
+    Читает файл, возвращает (meta, {имя: array или список строк})
+    """
+
+    with open(path, "rb") as file:
+        footer = _read_footer(file, path)
+        swap = footer["byteorder"] != sys.byteorder
+        columns = {}
+        for description in footer["columns"]:
+            file.seek(description["offset"])
+            if description["type"] == STR:
+                data = file.read(description["lengths_offset"] - description["offset"])
+                lengths = _read_array(file, "q", description["length"], swap)
+                values, position = [], 0
+                for length in lengths:
+                    values.append(data[position:position + length].decode("utf-8"))
+                    position += length
+            else:
+                values = _read_array(file, description["type"], description["length"], swap)
+            columns[description["name"]] = values
+    return footer["meta"], columns
+
+
+def _read_footer(file, path):
+    """
+    Проверяет MAGIC и читает JSON-футер
+    """
+
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ColumnarFormatError(f"{path} is not a columnar file")
+    file.seek(-(FOOTER_SIZE.size + len(MAGIC)), os.SEEK_END)
+    footer_size, = FOOTER_SIZE.unpack(file.read(FOOTER_SIZE.size))
+    if file.read() != MAGIC:
+        raise ColumnarFormatError(f"{path} is truncated")
+    file.seek(-(footer_size + FOOTER_SIZE.size + len(MAGIC)), os.SEEK_END)
+    return json.loads(file.read(footer_size))
+
+
+def _read_array(file, typecode, length, swap):
+    """
+    Читает length значений array(typecode) с текущей позиции файла
+    """
+
+    values = array(typecode)
+    values.fromfile(file, length)
+    if swap:
+        values.byteswap()
+    return values
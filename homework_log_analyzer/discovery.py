@@ -0,0 +1,137 @@
+"""
+Поиск логов nginx и построенных отчетов: один проход os.scandir по каталогу логов
+и индекс дат с готовыми отчетами вместо просмотра каталога отчетов на каждом запуске
+"""
+import json
+import logging
+import os
+import re
+from collections import namedtuple
+from datetime import datetime
+
+from atomicfile import atomic_open
+
+logger = logging.getLogger()
+
+LOG_NAME_PATTERN = re.compile(r'nginx-access-ui\.log-(?P<date>\d{8})(?:\.gz)?')
+REPORT_NAME_PATTERN = r'report-(?P<date>\d{{8}}){0}'
+# файл индекса в каталоге отчетов, по одному на формат основного отчета
+INDEX_NAME = ".report-index{0}.json"
+
+LogFile = namedtuple("LogFile", ["date", "path"])
+
+
+def parse_name_date(name, pattern):
+    """
+    Возвращает дату из имени файла, соответствующего pattern, или None
+    (в том числе для несуществующих дат вроде 20171340)
+    """
+
+    match = pattern.fullmatch(name)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match["date"], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def iter_logs(log_dir):
+    """
+    Отдает LogFile для каждого лога nginx-access-ui.log-YYYYMMDD(.gz) в log_dir
+    """
+
+    with os.scandir(log_dir) as entries:
+        for entry in entries:
+            day = parse_name_date(entry.name, LOG_NAME_PATTERN)
+            if day and entry.is_file():
+                yield LogFile(day, entry.path)
+
+
+def find_last_log(log_dir):
+    """
+    Возвращает LogFile последнего по дате лога или None, если логов нет
+    """
+
+    return max(iter_logs(log_dir), key=lambda log: log.date, default=None)
+
+
+def find_logs(log_dir, first, last):
+    """
+    Возвращает отсортированные по дате логи с датами от first до last включительно
+    """
+
+    return sorted(log for log in iter_logs(log_dir) if first <= log.date <= last)
+
+
+def report_name(day, suffix=".html"):
+    """
+    Возвращает имя файла отчета за дату
+    """
+
+    return f"report-{day:%Y%m%d}{suffix}"
+
+
+class ReportIndex:
+    """
+    Множество дат, за которые построены отчеты report-YYYYMMDD<suffix>, хранится в REPORT_DIR в INDEX_NAME.
+    Если индекса нет или он поврежден, он строится одним проходом по каталогу отчетов
+    """
+
+    def __init__(self, report_dir, suffix=".html"):
+        self.report_dir = report_dir
+        self.suffix = suffix
+        self.path = os.path.join(report_dir, INDEX_NAME.format(suffix))
+        self.dates = self.load()
+
+    def load(self):
+        """
+        Читает индекс, а если его нет, строит и сохраняет
+        """
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                return {datetime.strptime(value, "%Y%m%d").date() for value in json.load(file)["dates"]}
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError) as error:
+            logger.warning("report index %s is broken, rebuilding: %s", self.path, error)
+        dates = self.scan()
+        self.save(dates)
+        return dates
+
+    def scan(self):
+        """
+        Собирает даты отчетов просмотром каталога
+        """
+
+        pattern = re.compile(REPORT_NAME_PATTERN.format(re.escape(self.suffix)))
+        with os.scandir(self.report_dir) as entries:
+            return {day for day in (parse_name_date(entry.name, pattern) for entry in entries) if day}
+
+    def save(self, dates):
+        """
+        Атомарно записывает индекс
+        """
+
+        with atomic_open(self.path, encoding="utf-8") as file:
+            json.dump({"dates": sorted(f"{day:%Y%m%d}" for day in dates)}, file)
+
+    def __contains__(self, day):
+        if day not in self.dates:
+            return False
+        # отчет могли удалить вручную: проверяется только файл за эту дату
+        if os.path.exists(os.path.join(self.report_dir, report_name(day, self.suffix))):
+            return True
+        self.dates.discard(day)
+        self.save(self.dates)
+        return False
+
+    def add(self, day):
+        """
+        Отмечает дату как обработанную
+        """
+
+        if day not in self.dates:
+            self.dates.add(day)
+            self.save(self.dates)
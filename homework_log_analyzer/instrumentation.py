@@ -0,0 +1,97 @@
+"""
+Инструментирование log_analyzer: структурированные JSON-логи стадий и прогресса разбора, дамп cProfile
+"""
+import cProfile
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger()
+
+# как часто (в секундах) пишется прогресс разбора
+PROGRESS_INTERVAL = 10
+
+
+def log_event(event, **fields):
+    """
+    Пишет событие в лог одной строкой JSON
+    """
+
+    logger.info(json.dumps({"event": event, "pid": os.getpid(), **fields}, ensure_ascii=False))
+
+
+@contextmanager
+def stage(name, enabled=True):
+    """
+    Замеряет время стадии и пишет его в лог. В отдаваемый словарь можно добавить поля события,
+    например число строк или размер агрегата
+    """
+
+    fields = {}
+    if not enabled:
+        yield fields
+        return
+    start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield fields
+    finally:
+        log_event("stage", stage=name,
+                  seconds=round(time.perf_counter() - start, 3),
+                  cpu_seconds=round(time.process_time() - cpu_start, 3),
+                  **fields)
+
+
+class Progress:
+    """
+    Прогресс разбора одного лога или его части. Читатели лога увеличивают bytes_read,
+    агрегатор периодически вызывает update с числом строк и размером агрегата
+    """
+
+    def __init__(self, name, total_bytes=None, interval=PROGRESS_INTERVAL):
+        self.name = name
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.bytes_read = 0
+        self.started = time.monotonic()
+        self._next_report = self.started + interval
+
+    def update(self, lines, urls=None, force=False):
+        """
+        Пишет в лог прогресс, если с прошлой записи прошло не меньше interval секунд
+        """
+
+        now = time.monotonic()
+        if now < self._next_report and not force:
+            return
+        self._next_report = now + self.interval
+        elapsed = max(now - self.started, 1e-9)
+        log_event("progress", stage=self.name,
+                  lines=lines,
+                  bytes=self.bytes_read,
+                  total_bytes=self.total_bytes,
+                  urls=urls,
+                  seconds=round(elapsed, 3),
+                  lines_per_sec=round(lines / elapsed),
+                  mb_per_sec=round(self.bytes_read / elapsed / 2 ** 20, 2))
+
+
+@contextmanager
+def profile(path):
+    """
+    Профилирует блок через cProfile и сохраняет статистику в path (читается pstats или snakeviz).
+    Без path ничего не делает
+    """
+
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        log_event("profile", path=path)
@@ -2,16 +2,39 @@
 скрипт для анализа  логов nginx
 """
 import argparse
-import gzip
+import glob
+import heapq
 import json
 import logging
+import math
+import mmap
 import os
+import pickle
 import re
+import subprocess
 import sys
-from collections import defaultdict
+import zlib
+from array import array
+from collections import Counter, defaultdict, deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from datetime import datetime, timedelta
+from functools import lru_cache, partial
+from itertools import islice, repeat
 from operator import itemgetter
 from statistics import median
-from string import Template
+from time import perf_counter
+
+import columnar
+import discovery
+import writers
+from atomicfile import atomic_open
+from instrumentation import PROGRESS_INTERVAL, Progress, log_event, profile, stage
+from sketch import DEFAULT_ACCURACY, QuantileSketch
+
+try:
+    import numpy
+except ImportError:  # numpy необязателен, без него статистика считается средствами stdlib
+    numpy = None
 
 logging.basicConfig(
     format='[%(asctime)s] %(levelname)s %(message)s',
@@ -27,8 +50,208 @@ CONFIG_DIR = './config'
 default_config = {
     "REPORT_SIZE": 1000,
     "REPORT_DIR": "./reports",
-    "LOG_DIR": "./log"
+    "LOG_DIR": "./log",
+    "WORKERS": 1,
+    "AGGREGATION": "exact",
+    "SKETCH_ACCURACY": DEFAULT_ACCURACY,
+    "STRIP_QUERY": False,
+    "COLLAPSE_IDS": False,
+    "URL_RULES": [],
+    "MAX_URLS": None,
+    "INCREMENTAL": False,
+    "CHECKPOINT": "./log_analyzer.checkpoint",
+    "SAVE_AGGREGATES": True,
+    "GZIP_COMMAND": None,
+    "ERROR_THRESHOLD": None,
+    "ERROR_WINDOW": 10000,
+    "PROGRESS": False,
+    "PROGRESS_INTERVAL": PROGRESS_INTERVAL,
+    "PROFILE": None,
+    "REPORT_FORMATS": ["html"],
+    "INPUT": None,
+    "PER_HOST": False,
+    "HOST_PATTERN": None,
+    "LOG_FORMAT": None,
+    "EXTRACTOR": "auto",
+    "EXTRACTOR_SAMPLE": 10000,
+    "PERCENTILES": [],
+    "TIME_BUCKET": None,
+    "TIMELINE_FORMAT": "jsonl"
+}
+# размер пачки распакованных строк gzip-лога, передаваемой воркеру
+GZIP_BATCH_SIZE = 16 * 1024 * 1024
+# размер блока, которым читается gzip-лог, и wbits zlib для формата gzip
+GZIP_BLOCK_SIZE = 1024 * 1024
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+# параметры, от которых зависит агрегат; при их изменении checkpoint не используется
+AGGREGATION_KEYS = ("AGGREGATION", "SKETCH_ACCURACY", "STRIP_QUERY", "COLLAPSE_IDS", "URL_RULES", "MAX_URLS",
+                    "LOG_FORMAT", "TIME_BUCKET")
+# размер блока, которым ищется последний перевод строки в конце лога
+TAIL_BLOCK_SIZE = 64 * 1024
+# размер скользящего окна строк для ERROR_THRESHOLD по умолчанию
+ERROR_WINDOW = 10000
+# через сколько строк агрегатор проверяет, не пора ли писать прогресс
+PROGRESS_LINES = 65536
+# размер блока plain-лога, который делится на строки для позиционного извлечения полей
+SPLIT_BLOCK_SIZE = 1024 * 1024
+# шаблон html-отчета и место в нем для строк отчета
+REPORT_TEMPLATE = "./reports/report.html"
+TABLE_PLACEHOLDER = "$table_json"
+# с какого числа значений статистика url считается через numpy, на меньших выборках быстрее stdlib
+NUMPY_MIN_SIZE = 64
+
+
+LOG_TEMPLATE = '$remote_addr $remote_user  $http_x_real_ip [$time_local] "$request" ' \
+               '$status $body_bytes_sent "$http_referer" "$http_user_agent" ' \
+               '"$http_x_forwarded_for" "$http_X_REQUEST_ID" "$http_X_RB_USER" $request_time'
+LOG_FIELDS = ('request', 'request_time')
+# поля для разбивки по интервалам времени (TIME_BUCKET)
+TIMELINE_FIELDS = LOG_FIELDS + ('time_local',)
+# группа для значения поля выбирается по символу, который идет за ним в формате; перевод строки
+# в значение не входит: иначе обрезанная строка склеивается со следующей при поиске по всему mmap
+FIELD_PATTERNS = {
+    '"': r'[^"\n]*',
+    ']': r'[^\]\n]*',
 }
+DEFAULT_FIELD_PATTERN = r'\S*'
+# $request_time всегда число: обрезанная или испорченная строка не должна считаться разобранной
+REQUEST_TIME_PATTERN = r'\d+(?:\.\d+)?'
+REQUEST_PATTERN = r'(?:(?i:GET|POST) (?P<url>{0}) (?i:HTTP)/\d\.\d|(?P<request>{0}))'
+
+
+def compile_log_format(log_format, fields=LOG_FIELDS, binary=False):
+    """
+    Один раз компилирует формат лога nginx в якорное регулярное выражение
+    (для bytes, если binary). Именованные группы создаются только для полей из fields,
+    остальные поля пропускаются незахватывающими группами
+    """
+
+    # MULTILINE: '^' и '$' привязаны к границам строки и внутри большого буфера (mmap)
+    parts = ['^']
+    pos = 0
+    for match in re.finditer(r'\$(\w+)', log_format):
+        parts.append(re.escape(log_format[pos:match.start()]))
+        field_pattern = FIELD_PATTERNS.get(log_format[match.end():match.end() + 1], DEFAULT_FIELD_PATTERN)
+        if match[1] == 'request_time':
+            field_pattern = REQUEST_TIME_PATTERN
+        if match[1] == 'request' and 'request' in fields:
+            # url выделяется из $request тем же проходом, иначе берется весь $request
+            parts.append(REQUEST_PATTERN.format(field_pattern))
+        elif match[1] in fields:
+            parts.append(f'(?P<{match[1]}>{field_pattern})')
+        else:
+            parts.append(f'(?:{field_pattern})')
+        pos = match.end()
+    parts.append(re.escape(log_format[pos:]))
+    parts.append(r'[ \t\r]*$')
+    pattern = ''.join(parts)
+    return re.compile(pattern.encode() if binary else pattern, re.MULTILINE)
+
+
+LOG_PATTERN = compile_log_format(LOG_TEMPLATE)
+LOG_PATTERN_BYTES = compile_log_format(LOG_TEMPLATE, binary=True)
+# переменные nginx, значения которых могут содержать пробелы, если записаны без кавычек
+SPACED_VARIABLE_PATTERN = re.compile(r'\$(?:time_local|request|http_\w+|sent_http_\w+|cookie_\w+)\b')
+VARIABLE_PATTERN = re.compile(r'\$(\w+)')
+PROTOCOL_PATTERN = re.compile(rb'(?i:HTTP)/\d\.\d')
+REQUEST_TIME_BYTES_PATTERN = re.compile(REQUEST_TIME_PATTERN.encode())
+# способы извлечения полей: регулярное выражение или позиционный split
+EXTRACTORS = ("regex", "split")
+
+Extractor = namedtuple("Extractor", ["name", "pattern", "parse", "extract"])
+
+
+def compile_split_extractor(log_format, pattern):
+    """
+    Строит позиционный извлекатель url и request_time для bytes-строки через split по кавычкам,
+    если формат это позволяет, иначе возвращает None. Поле должно либо целиком занимать значение
+    в кавычках, либо стоять в части без кавычек так, чтобы между ним и началом или концом части
+    не было полей с пробелами. Строки с другим числом кавычек разбираются регулярным выражением pattern
+    """
+
+    segments = log_format.split('"')
+    positions = {}
+    for number, segment in enumerate(segments):
+        if number % 2:
+            match = VARIABLE_PATTERN.fullmatch(segment)
+            if match and match[1] in LOG_FIELDS:
+                positions[match[1]] = (number, None)
+            continue
+        tokens = segment.split()
+        for index, token in enumerate(tokens):
+            match = VARIABLE_PATTERN.fullmatch(token)
+            if not match or match[1] not in LOG_FIELDS:
+                continue
+            if not any(map(SPACED_VARIABLE_PATTERN.search, tokens[:index])):
+                positions[match[1]] = (number, index)
+            elif not any(map(SPACED_VARIABLE_PATTERN.search, tokens[index + 1:])):
+                positions[match[1]] = (number, index - len(tokens))
+    if set(positions) != set(LOG_FIELDS):
+        return None
+
+    parts_count = len(segments)
+    request_part, request_token = positions['request']
+    time_part, time_token = positions['request_time']
+    fullmatch_protocol = PROTOCOL_PATTERN.fullmatch
+    fullmatch_time = REQUEST_TIME_BYTES_PATTERN.fullmatch
+    fallback = partial(process_line_bytes, pattern=pattern)
+
+    def parse(line):
+        parts = line.split(b'"')
+        if len(parts) != parts_count:
+            return fallback(line)
+        try:
+            request = parts[request_part] if request_token is None else parts[request_part].split()[request_token]
+            request_time = parts[time_part] if time_token is None else parts[time_part].split()[time_token]
+        except IndexError:
+            return fallback(line)
+        if not fullmatch_time(request_time):
+            return None
+        # url выделяется из $request так же, как в REQUEST_PATTERN
+        method, separator, rest = request.partition(b' ')
+        url, separator, protocol = rest.rpartition(b' ')
+        if not (separator and method.upper() in (b'GET', b'POST') and fullmatch_protocol(protocol)):
+            url = request
+        return url.decode("utf-8", "replace"), request_time.decode("ascii")
+
+    return parse
+
+
+@lru_cache(maxsize=None)
+def make_extractor(log_format=LOG_TEMPLATE, name="regex", timeline=False):
+    """
+    Один раз компилирует формат лога в Extractor: bytes-регулярку, функцию разбора строки
+    и функцию извлечения полей из совпадения регулярки. С timeline к url и request_time
+    добавляется $time_local. Для name="split" возвращает None, если формат
+    не позволяет позиционное извлечение (в том числе с timeline)
+    """
+
+    if timeline and '$time_local' not in log_format:
+        raise ValueError("TIME_BUCKET requires $time_local in LOG_FORMAT")
+    if timeline:
+        pattern, extract = compile_log_format(log_format, TIMELINE_FIELDS, binary=True), extract_timeline_fields
+    elif log_format == LOG_TEMPLATE:
+        pattern, extract = LOG_PATTERN_BYTES, extract_fields
+    else:
+        pattern, extract = compile_log_format(log_format, binary=True), extract_fields
+    if name == "regex":
+        return Extractor(name, pattern, lambda line: extract(pattern.match(line)), extract)
+    if name == "split":
+        parse = None if timeline else compile_split_extractor(log_format, pattern)
+        return parse and Extractor(name, pattern, parse, extract)
+    raise ValueError(f"unknown EXTRACTOR: {name}")
+
+
+# числовые и длинные шестнадцатеричные сегменты пути, которые схлопываются при COLLAPSE_IDS
+ID_SEGMENT_PATTERN = re.compile(r'(?<=/)(?:(?P<number>\d+)|(?=[a-f]*\d)[0-9a-f]{8,})(?=[/?;]|$)', re.I)
+# корзина для url сверх MAX_URLS
+OTHER_URL = 'OTHER'
+
+
+class ErrorThresholdExceeded(Exception):
+    """
+    Доля неразобранных строк лога превысила ERROR_THRESHOLD
+    """
 
 
 def load_config(cfg_path, default_cfg):
@@ -46,124 +269,1140 @@ def load_config(cfg_path, default_cfg):
 
 def find_last_date_log(log_dir):
     """
-    Ищет последний по дате log
+    Ищет последний по дате log nginx-access-ui.log-YYYYMMDD(.gz).
+    Возвращает дату YYYYMMDD и имя файла или две пустые строки
     """
 
-    last_date = last_log = ''
-    for file in os.listdir(log_dir):
-        date = re.findall(r'\d+', str(file))
-        if date and date[0] > last_date:
-            last_date = date[0]
-            last_log = file
-        else:
-            continue
-    if last_log:
-        logger.debug("found last log: %s", last_log)
-    return last_date, last_log
+    last_log = discovery.find_last_log(log_dir)
+    if not last_log:
+        return '', ''
+    logger.debug("found last log: %s", last_log.path)
+    return f"{last_log.date:%Y%m%d}", os.path.basename(last_log.path)
 
 
-def check_exist_report(date_last_log, report_dir):
+def check_exist_report(date_last_log, report_dir, report_format="html"):
     """
-    Проверяет создан создан отчет или нет
+    Проверяет создан создан отчет или нет (по индексу отчетов, без просмотра каталога).
+    Если логов нет и дата пустая, отчета тоже нет
     """
 
-    for file in os.listdir(report_dir):
-        date = re.findall(r'\d+', str(file))
-        if date and date[0] == date_last_log:
-            return True
-    return False
+    if not date_last_log:
+        return False
+    day = datetime.strptime(date_last_log, "%Y%m%d").date()
+    return day in discovery.ReportIndex(report_dir, writers.SUFFIXES[report_format])
 
 
-def read_lines(path):
+def read_lines(path, gzip_command=None, progress=None, extractor=None, **error_limits):
     """
-    Открывает лог и построчно читает и передает в обработку
+    Открывает лог и построчно читает и передает в обработку.
+    plain-лог разбирается через mmap (read_chunk), gzip-лог распаковывается
+    большими блоками, оба разбираются как bytes
     :param path:
+    :param gzip_command: внешняя команда распаковки, например ["pigz", "-dc"]
+    :param progress: Progress, в котором считаются прочитанные байты
+    :param extractor: Extractor, которым извлекаются поля (по умолчанию regex для LOG_TEMPLATE)
+    :param error_limits: error_threshold и error_window для count_parsed
     :return:
     """
 
-    open_flag = gzip.open if path.endswith(".gz") else open
-    with open_flag(path, "rt", encoding="utf-8") as lines:
-        total = processed = 0
-        for line in lines:
-            parsed_line = process_line(line)
-            total += 1
-            if parsed_line:
-                processed += 1
-                yield parsed_line
+    if path.endswith(".gz"):
+        blocks = read_gzip_blocks(path, gzip_command, progress=progress)
+        parse = extractor.parse if extractor else process_line_bytes
+        yield from parse_lines(split_lines(blocks), parse, **error_limits)
+    else:
+        yield from read_chunk(path, progress=progress, extractor=extractor, **error_limits)
+
+
+def read_gzip_blocks(path, gzip_command=None, block_size=GZIP_BLOCK_SIZE, progress=None):
+    """
+    Отдает распакованное содержимое gzip-лога блоками: через zlib или,
+    если задана gzip_command, из stdout внешней команды (zcat, pigz -dc).
+    В progress считаются прочитанные сжатые байты (для внешней команды они неизвестны)
+    """
+
+    if gzip_command:
+        with subprocess.Popen([*gzip_command, path], stdout=subprocess.PIPE, bufsize=block_size) as process:
+            while True:
+                block = process.stdout.read(block_size)
+                if not block:
+                    break
+                yield block
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, gzip_command)
+        return
+
+    with open(path, "rb") as file:
+        decompressor = zlib.decompressobj(GZIP_WBITS)
+        started = False
+        while True:
+            data = file.read(block_size)
+            if not data:
+                break
+            started = True
+            if progress is not None:
+                progress.bytes_read += len(data)
+            while data:
+                yield decompressor.decompress(data)
+                # после конца одного gzip-члена может начинаться следующий
+                data = decompressor.unused_data
+                if data:
+                    decompressor = zlib.decompressobj(GZIP_WBITS)
+        yield decompressor.flush()
+        # обрезанный gzip (например, скопированный во время ротации) не должен разбираться как целый
+        if started and not decompressor.eof:
+            raise EOFError(f"Compressed file ended before the end-of-stream marker was reached: {path}")
+
+
+def split_lines(blocks):
+    """
+    Делит поток блоков bytes на строки без копирования каждой строки через буфер файла
+    """
+
+    tail = b""
+    for block in blocks:
+        lines = (tail + block).split(b"\n")
+        tail = lines.pop()
+        yield from lines
+    if tail:
+        yield tail
+
+
+def read_chunk(path, start=0, end=None, pattern=None, progress=None, extractor=None, **error_limits):
+    """
+    Разбирает строки plain-лога в диапазоне байт [start, end), выровненном по началу строк,
+    прямо в mmap: регулярное выражение ищет совпадения по отображенному файлу без копирования
+    и декодирования строк, декодируются только url и request_time.
+    С позиционным extractor (split) диапазон делится на строки блоками по SPLIT_BLOCK_SIZE
+    """
+
+    pattern = pattern or (extractor.pattern if extractor else LOG_PATTERN_BYTES)
+    extract = extractor.extract if extractor else extract_fields
+
+    def split_blocks(mapped, stop):
+        for block_start in range(start, stop, SPLIT_BLOCK_SIZE):
+            block_end = min(block_start + SPLIT_BLOCK_SIZE, stop)
+            yield mapped[block_start:block_end]
+            if progress is not None:
+                progress.bytes_read = block_end - start
+
+    def parsed_lines():
+        with open(path, "rb") as file:
+            if not os.fstat(file.fileno()).st_size:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                stop = len(mapped) if end is None else end
+                if extractor is not None and extractor.name == "split":
+                    yield from map(extractor.parse, split_lines(split_blocks(mapped, stop)))
+                    return
+                position = start
+                for search_matches in pattern.finditer(mapped, start, stop):
+                    if search_matches.start() != position:
+                        # строки между совпадениями не соответствуют формату
+                        yield from repeat(None, mapped[position:search_matches.start()].count(b"\n"))
+                    yield extract(search_matches)
+                    position = search_matches.end() + 1
+                    if progress is not None:
+                        progress.bytes_read = position - start
+                if position < stop:
+                    tail = mapped[position:stop]
+                    yield from repeat(None, tail.count(b"\n") + (not tail.endswith(b"\n")))
+                if progress is not None:
+                    progress.bytes_read = stop - start
+
+    yield from count_parsed(parsed_lines(), **error_limits)
+
+
+def parse_lines(lines, parse=None, **error_limits):
+    """
+    Передает строки в process_line (или parse) и считает обработанные
+    """
+
+    yield from count_parsed(map(parse or process_line, lines), **error_limits)
+
+
+def count_parsed(parsed_lines, error_threshold=None, error_window=ERROR_WINDOW, counts=None):
+    """
+    Пропускает неразобранные строки (None) и считает обработанные.
+    Если задан error_threshold, прерывает разбор исключением ErrorThresholdExceeded,
+    как только доля неразобранных среди последних error_window строк (или среди всех
+    строк в конце разбора) превышает порог. Если передан Counter counts, в него добавляются
+    числа неразобранных (failed) и всех (total) строк, а долю среди всех строк проверяет
+    вызывающий: воркер видит только часть лога
+    """
+
+    # номера неразобранных строк в окне: на разобранных строках проверка ничего не стоит
+    failures = deque()
+    max_failures = None if error_threshold is None else error_threshold * error_window
+    total = processed = 0
+    for parsed_line in parsed_lines:
+        total += 1
+        if parsed_line:
+            processed += 1
+            yield parsed_line
+        elif max_failures is not None:
+            failures.append(total)
+            while failures[0] <= total - error_window:
+                failures.popleft()
+            if len(failures) > max_failures:
+                raise ErrorThresholdExceeded(
+                    f"{len(failures)} of last {error_window} lines are not parsed (line {total}), "
+                    f"ERROR_THRESHOLD is {error_threshold}"
+                )
     logger.debug("%s of %s lines processed", processed, total)
+    if counts is not None:
+        counts.update(failed=total - processed, total=total)
+    else:
+        check_error_ratio(total - processed, total, error_threshold)
 
 
-def process_line(line):
+def check_error_ratio(failed, total, error_threshold=None):
     """
-    Обрабатывает строки
+    Бросает ErrorThresholdExceeded, если доля неразобранных строк среди всех превышает error_threshold
     """
 
-    log_template = '$remote_addr $remote_user  $http_x_real_ip [$time_local] "$request" ' \
-                   '$status $body_bytes_sent "$http_referer" "$http_user_agent" ' \
-                   '"$http_x_forwarded_for" "$http_X_REQUEST_ID" "$http_X_RB_USER" $request_time'
+    if error_threshold is not None and total and failed / total > error_threshold:
+        raise ErrorThresholdExceeded(
+            f"{failed} of {total} lines are not parsed, ERROR_THRESHOLD is {error_threshold}"
+        )
+
 
-    mask = re.sub(r'([\[\]\"{}])', r'\\\1', log_template)
-    pattern = re.sub(r'\$(\w+)', r'(?P<\1>.+)', mask)
-    search_matches = re.search(pattern, line)
-    request_time = search_matches['request_time']
-    request = search_matches['request']
+def error_limits_for(cfg):
+    """
+    Возвращает параметры count_parsed из cfg
+    """
 
-    url_pattern = re.compile(r'((GET|POST) (?P<url>.+) (http/\d\.\d))', re.I)
-    url_search = re.search(url_pattern, request)
-    url = url_search['url'] if url_search else request
-    return url, request_time
+    return {"error_threshold": cfg.get("ERROR_THRESHOLD"), "error_window": cfg.get("ERROR_WINDOW") or ERROR_WINDOW}
 
 
-def get_report_data(file_path):
+def extractor_for(cfg):
     """
-    Получает данные для отчета
+    Возвращает Extractor для LOG_FORMAT и EXTRACTOR из cfg; пока EXTRACTOR не выбран (auto), - regex
+    """
+
+    name = cfg.get("EXTRACTOR")
+    return make_extractor(cfg.get("LOG_FORMAT") or LOG_TEMPLATE, name if name in EXTRACTORS else "regex",
+                          bool(cfg.get("TIME_BUCKET")))
+
+
+def sample_lines(path, count, gzip_command=None):
+    """
+    Возвращает первые count строк лога
+    """
+
+    if path.endswith(".gz"):
+        blocks = read_gzip_blocks(path, gzip_command)
+        try:
+            return list(islice(split_lines(blocks), count))
+        finally:
+            blocks.close()
+    with open(path, "rb") as file:
+        return list(islice(split_lines(iter(partial(file.read, SPLIT_BLOCK_SIZE), b"")), count))
+
+
+def choose_extractor(file_path, cfg):
+    """
+    Для EXTRACTOR "auto" выбирает самый быстрый способ извлечения полей на первых EXTRACTOR_SAMPLE
+    строках лога среди тех, что дают на них тот же результат, что и регулярное выражение.
+    Возвращает cfg с выбранным EXTRACTOR, чтобы воркеры не выбирали его заново
+    """
+
+    if cfg.get("EXTRACTOR") in EXTRACTORS:
+        return cfg
+    if cfg.get("EXTRACTOR") not in (None, "auto"):
+        raise ValueError(f"unknown EXTRACTOR: {cfg.get('EXTRACTOR')}")
+    log_format = cfg.get("LOG_FORMAT") or LOG_TEMPLATE
+    timeline = bool(cfg.get("TIME_BUCKET"))
+    regex, split = make_extractor(log_format, "regex", timeline), make_extractor(log_format, "split", timeline)
+    chosen = "regex"
+    lines = sample_lines(file_path, cfg.get("EXTRACTOR_SAMPLE") or 10000, cfg.get("GZIP_COMMAND"))
+    if split and lines and list(map(split.parse, lines)) == list(map(regex.parse, lines)):
+        # plain-лог регуляркой разбирается прямо в mmap через finditer, gzip-лог - по строкам
+        buffer = b"\n".join(lines) if not file_path.endswith(".gz") else None
+        timings = {}
+        for extractor in (regex, split):
+            start = perf_counter()
+            if extractor is regex and buffer is not None:
+                list(map(regex.extract, regex.pattern.finditer(buffer)))
+            else:
+                list(map(extractor.parse, lines))
+            timings[extractor.name] = perf_counter() - start
+        chosen = min(timings, key=timings.get)
+        logger.debug("extractor timings on %s lines of %s: %s", len(lines), file_path, timings)
+    logger.debug("using %s extractor for %s", chosen, file_path)
+    return {**cfg, "EXTRACTOR": chosen}
+
+
+def process_line(line, pattern=None):
+    """
+    Обрабатывает строки, возвращает (url, request_time) или None,
+    если строка не соответствует формату лога
+    """
+
+    search_matches = (pattern or LOG_PATTERN).match(line)
+    if not search_matches:
+        return None
+    url = search_matches['url']
+    if url is None:
+        url = search_matches['request']
+    return url, search_matches['request_time']
+
+
+def process_line_bytes(line, pattern=None):
+    """
+    Обрабатывает строку bytes, декодируя только url и request_time,
+    возвращает (url, request_time) или None
     """
-    report_data = defaultdict(list)
+
+    return extract_fields((pattern or LOG_PATTERN_BYTES).match(line))
+
+
+def extract_fields(search_matches):
+    """
+    Декодирует url и request_time из совпадения bytes-регулярки, None если совпадения нет
+    """
+
+    if not search_matches:
+        return None
+    url = search_matches['url']
+    if url is None:
+        url = search_matches['request']
+    return url.decode("utf-8", "replace"), search_matches['request_time'].decode("ascii")
+
+
+def extract_timeline_fields(search_matches):
+    """
+    Как extract_fields, но добавляет $time_local для разбивки по интервалам времени
+    """
+
+    fields = extract_fields(search_matches)
+    if fields is None:
+        return None
+    return (*fields, search_matches['time_local'].decode("ascii"))
+
+
+def make_timings_factory(cfg):
+    """
+    Возвращает конструктор хранилища времен одного url по режиму AGGREGATION:
+    exact - все значения в array('d') (8 байт на значение вместо ~32 у list из float),
+    approximate - QuantileSketch ограниченного размера
+    """
+
+    mode = cfg.get("AGGREGATION", "exact")
+    if mode == "exact":
+        return partial(array, "d")
+    if mode == "approximate":
+        return partial(QuantileSketch, cfg.get("SKETCH_ACCURACY", DEFAULT_ACCURACY))
+    raise ValueError(f"unknown AGGREGATION mode: {mode}")
+
+
+def make_url_normalizer(cfg):
+    """
+    Возвращает функцию нормализации url по STRIP_QUERY, COLLAPSE_IDS и URL_RULES
+    или None, если нормализация не настроена
+    """
+
+    strip_query = cfg.get("STRIP_QUERY")
+    collapse_ids = cfg.get("COLLAPSE_IDS")
+    rules = [(re.compile(pattern), replacement) for pattern, replacement in cfg.get("URL_RULES") or ()]
+    if not (strip_query or collapse_ids or rules):
+        return None
+
+    def normalize(url):
+        if strip_query:
+            url = url.partition('?')[0]
+        if collapse_ids:
+            url = ID_SEGMENT_PATTERN.sub(_id_placeholder, url)
+        for pattern, replacement in rules:
+            url = pattern.sub(replacement, url)
+        return url
+
+    return normalize
+
+
+def _id_placeholder(match):
+    """
+    Возвращает заглушку для схлопнутого сегмента url
+    """
+
+    return '{id}' if match['number'] else '{hex}'
+
+
+def aggregate(parsed_lines, timings_factory=list, normalize=None, max_urls=None, progress=None,
+              bucket=None, cell_factory=None):
+    """
+    Собирает времена запросов по url. Url проходят через normalize, а если различных url
+    уже max_urls, новые попадают в общую корзину OTHER_URL. Каждые PROGRESS_LINES строк
+    прогресс передается в progress. Если задан bucket, строки содержат еще и $time_local,
+    времена дополнительно собираются в timeline по (интервал bucket($time_local), url)
+    в компактные агрегаты cell_factory, а результат получает четвертый элемент - timeline
+    """
+
+    report_data = defaultdict(timings_factory)
     total_time = 0.0
-    total_count = 1
-    for url, time in read_lines(file_path):
-        total_time += float(time)
+    total_count = 0
+    if bucket is not None:
+        # отдельный цикл, чтобы разбор без разбивки по времени не платил за нее ни одной проверкой
+        timeline = defaultdict(cell_factory)
+        for url, time, time_local in parsed_lines:
+            if normalize:
+                url = normalize(url)
+            if max_urls and url not in report_data and len(report_data) >= max_urls:
+                url = OTHER_URL
+            time = float(time)
+            total_time += time
+            total_count += 1
+            report_data[url].append(time)
+            timeline[bucket(time_local), url].append(time)
+            if progress is not None and not total_count % PROGRESS_LINES:
+                progress.update(total_count, len(report_data))
+        if progress is not None:
+            progress.update(total_count, len(report_data), force=True)
+        return total_count, total_time, report_data, timeline
+
+    for url, time in parsed_lines:
+        if normalize:
+            url = normalize(url)
+        if max_urls and url not in report_data and len(report_data) >= max_urls:
+            url = OTHER_URL
+        time = float(time)
+        total_time += time
         total_count += 1
-        if url in report_data:
-            report_data[url].append(float(time))
+        report_data[url].append(time)
+        if progress is not None and not total_count % PROGRESS_LINES:
+            progress.update(total_count, len(report_data))
+    if progress is not None:
+        progress.update(total_count, len(report_data), force=True)
+    return total_count, total_time, report_data
+
+
+def aggregate_lines(parsed_lines, cfg, progress=None):
+    """
+    Собирает времена запросов по url с настройками агрегации из cfg
+    """
+
+    bucket = cell_factory = None
+    if cfg.get("TIME_BUCKET"):
+        bucket = make_time_bucketer(cfg["TIME_BUCKET"])
+        cell_factory = partial(QuantileSketch, cfg.get("SKETCH_ACCURACY", DEFAULT_ACCURACY))
+    return aggregate(parsed_lines, make_timings_factory(cfg), make_url_normalizer(cfg), cfg.get("MAX_URLS"),
+                     progress, bucket, cell_factory)
+
+
+def make_progress(cfg, name, total_bytes=None):
+    """
+    Создает Progress, если в cfg включен PROGRESS, иначе None (инструментирование выключено)
+    """
+
+    if not cfg.get("PROGRESS"):
+        return None
+    return Progress(name, total_bytes, cfg.get("PROGRESS_INTERVAL") or PROGRESS_INTERVAL)
+
+
+def make_time_bucketer(minutes):
+    """
+    Возвращает функцию, которая переводит $time_local (29/Jun/2017:03:50:22 +0300) в начало
+    интервала длиной minutes минут по местному времени лога, например "2017-06-29T03:45".
+    Из строки по фиксированным позициям берется минута, дата разбирается один раз на каждую
+    минуту лога, а не на каждую строку
+    """
+
+    if not 0 < minutes <= 1440 or 1440 % minutes:
+        raise ValueError(f"TIME_BUCKET must divide a day into whole intervals: {minutes}")
+    labels = {}
+
+    def bucket(time_local):
+        minute = time_local[:17]
+        label = labels.get(minute)
+        if label is None:
+            try:
+                moment = datetime.strptime(minute, "%d/%b/%Y:%H:%M")
+            except ValueError:
+                label = "unknown"
+            else:
+                moment -= timedelta(minutes=(moment.hour * 60 + moment.minute) % minutes)
+                label = f"{moment:%Y-%m-%dT%H:%M}"
+            labels[minute] = label
+        return label
+
+    return bucket
+
+
+def merge_report_data(results, max_urls=None):
+    """
+    Объединяет частичные агрегаты (total_count, total_time, report_data[, timeline]) в один
+    """
+
+    report_data = {}
+    timeline = None
+    total_time = 0.0
+    total_count = 0
+    for count, time, data, *partial_timeline in results:
+        total_count += count
+        total_time += time
+        other = set()
+        for url, timings in data.items():
+            if max_urls and url not in report_data and len(report_data) >= max_urls:
+                other.add(url)
+                url = OTHER_URL
+            if url in report_data:
+                report_data[url] += timings
+            else:
+                report_data[url] = timings
+        if partial_timeline:
+            timeline = {} if timeline is None else timeline
+            for (label, url), cell in partial_timeline[0].items():
+                key = (label, OTHER_URL if url in other else url)
+                if key in timeline:
+                    timeline[key] += cell
+                else:
+                    timeline[key] = cell
+    if timeline is not None:
+        return total_count, total_time, report_data, timeline
+    return total_count, total_time, report_data
+
+
+def split_file(path, parts, start=0, end=None):
+    """
+    Делит диапазон байт plain-лога [start, end) на части, границы которых выровнены по началу строк
+    """
+
+    end = os.path.getsize(path) if end is None else end
+    offsets = [start]
+    with open(path, "rb") as file:
+        for part in range(1, parts):
+            file.seek(max(start + (end - start) * part // parts, offsets[-1]))
+            file.readline()
+            offsets.append(min(file.tell(), end))
+    offsets.append(end)
+    return [(chunk_start, chunk_end) for chunk_start, chunk_end in zip(offsets, offsets[1:])
+            if chunk_start < chunk_end]
+
+
+def find_last_line_end(path, start, end):
+    """
+    Возвращает позицию сразу после последнего перевода строки в диапазоне [start, end),
+    чтобы не разбирать недописанную строку растущего лога
+    """
+
+    with open(path, "rb") as file:
+        position = end
+        while position > start:
+            block_start = max(start, position - TAIL_BLOCK_SIZE)
+            file.seek(block_start)
+            newline = file.read(position - block_start).rfind(b"\n")
+            if newline != -1:
+                return block_start + newline + 1
+            position = block_start
+    return start
+
+
+def aggregate_chunk(path, start, end, cfg):
+    """
+    Считает частичный агрегат по диапазону байт plain-лога (выполняется в процессе-воркере).
+    Возвращает агрегат и Counter с числами неразобранных и всех строк
+    """
+
+    counts = Counter()
+    progress = make_progress(cfg, f"{path}:{start}-{end}", end - start)
+    parsed_lines = read_chunk(path, start, end, progress=progress, extractor=extractor_for(cfg), counts=counts,
+                              **error_limits_for(cfg))
+    return aggregate_lines(parsed_lines, cfg, progress), counts
+
+
+def aggregate_batch(data, cfg):
+    """
+    Считает частичный агрегат по пачке строк gzip-лога (выполняется в процессе-воркере).
+    Возвращает агрегат и Counter с числами неразобранных и всех строк
+    """
+
+    counts = Counter()
+    parsed_lines = parse_lines(split_lines((data,)), extractor_for(cfg).parse, counts=counts, **error_limits_for(cfg))
+    return aggregate_lines(parsed_lines, cfg), counts
+
+
+def merge_partials(partials, cfg):
+    """
+    Объединяет частичные агрегаты воркеров (агрегат, counts) и проверяет долю неразобранных строк
+    среди всех строк лога
+    """
+
+    counts = Counter()
+
+    def results():
+        for result, partial_counts in partials:
+            counts.update(partial_counts)
+            yield result
+
+    report = merge_report_data(results(), cfg.get("MAX_URLS"))
+    check_error_ratio(counts["failed"], counts["total"], cfg.get("ERROR_THRESHOLD"))
+    return report
+
+
+def read_batches(path, gzip_command=None, batch_size=GZIP_BATCH_SIZE, progress=None):
+    """
+    Потоково распаковывает gzip-лог и отдает пачки целых строк размером около batch_size байт
+    """
+
+    buffer = bytearray()
+    for block in read_gzip_blocks(path, gzip_command, progress=progress):
+        buffer += block
+        if len(buffer) >= batch_size:
+            cut = buffer.rfind(b"\n") + 1
+            if cut:
+                yield bytes(buffer[:cut])
+                del buffer[:cut]
+    if buffer:
+        yield bytes(buffer)
+
+
+def aggregate_range(file_path, start, end, cfg):
+    """
+    Считает агрегат по диапазону байт plain-лога [start, end), в WORKERS процессах, если их больше одного
+    """
+
+    workers = cfg.get("WORKERS") or 1
+    if workers == 1:
+        return merge_partials([aggregate_chunk(file_path, start, end, cfg)], cfg)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(aggregate_chunk, file_path, chunk_start, chunk_end, cfg)
+                   for chunk_start, chunk_end in split_file(file_path, workers, start, end)]
+        try:
+            return merge_partials((future.result() for future in futures), cfg)
+        except ErrorThresholdExceeded:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+
+def get_report_data_parallel(file_path, cfg):
+    """
+    Получает данные для отчета, разбирая лог в WORKERS процессах
+    """
+
+    if not file_path.endswith(".gz"):
+        return aggregate_range(file_path, 0, os.path.getsize(file_path), cfg)
+
+    workers = cfg["WORKERS"]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # распаковка gzip последовательна, поэтому пачки строк раздаются воркерам по мере чтения,
+        # а число пачек в очереди ограничено, чтобы не держать в памяти весь лог
+        progress = make_progress(cfg, file_path, os.path.getsize(file_path))
+
+        def results():
+            pending = set()
+            lines = 0
+            for batch in read_batches(file_path, cfg.get("GZIP_COMMAND"), progress=progress):
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result = future.result()
+                        lines += result[0][0]
+                        yield result
+                    if progress is not None:
+                        progress.update(lines)
+                pending.add(executor.submit(aggregate_batch, batch, cfg))
+            yield from (future.result() for future in as_completed(pending))
+
+        try:
+            return merge_partials(results(), cfg)
+        except ErrorThresholdExceeded:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+
+def get_report_data(file_path, cfg=None):
+    """
+    Получает данные для отчета
+    """
+
+    cfg = choose_extractor(file_path, cfg or default_config)
+    if (cfg.get("WORKERS") or 1) > 1:
+        return get_report_data_parallel(file_path, cfg)
+    progress = make_progress(cfg, file_path, os.path.getsize(file_path))
+    parsed_lines = read_lines(file_path, cfg.get("GZIP_COMMAND"), progress, extractor_for(cfg), **error_limits_for(cfg))
+    return aggregate_lines(parsed_lines, cfg, progress)
+
+
+def expand_inputs(patterns):
+    """
+    Раскрывает glob-шаблоны и пути логов в список файлов без повторов
+    """
+
+    paths = []
+    for pattern in patterns:
+        matched = sorted(glob.glob(pattern))
+        if not matched:
+            logger.warning("no logs match %s", pattern)
+        paths.extend(matched)
+    return list(dict.fromkeys(paths))
+
+
+def host_name(path, host_pattern=None):
+    """
+    Возвращает хост, к которому относится лог: группу host регулярного выражения host_pattern
+    в пути лога, а по умолчанию - имя каталога лога (log/<host>/nginx-access-ui.log-YYYYMMDD)
+    """
+
+    if host_pattern:
+        match = re.search(host_pattern, path)
+        if match:
+            return match["host"]
+    return os.path.basename(os.path.dirname(os.path.abspath(path)))
+
+
+def aggregate_file(file_path, cfg):
+    """
+    Считает агрегат одного из нескольких логов (выполняется в процессе-воркере)
+    """
+
+    return get_report_data(file_path, {**cfg, "WORKERS": 1})
+
+
+def get_report_data_multi(paths, cfg, on_host=None):
+    """
+    Получает общие данные для отчета по нескольким логам, например логам разных хостов за день.
+    Логи разбираются параллельно в WORKERS процессах, по одному логу на процесс, и объединяются
+    по мере готовности. Если задан on_host, он вызывается с именем хоста и агрегатом его логов
+    до объединения их в общий
+    """
+
+    if len(paths) == 1 and not on_host:
+        return get_report_data(paths[0], cfg)
+    hosts = {}
+    with ProcessPoolExecutor(max_workers=min(cfg.get("WORKERS") or 1, len(paths))) as executor:
+        futures = {executor.submit(aggregate_file, path, cfg): path for path in paths}
+        try:
+            for future in as_completed(futures):
+                host = host_name(futures[future], cfg.get("HOST_PATTERN"))
+                result = future.result()
+                if host in hosts:
+                    result = merge_report_data([hosts[host], result], cfg.get("MAX_URLS"))
+                hosts[host] = result
+        except ErrorThresholdExceeded:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    # агрегаты хостов объединяются на месте, поэтому on_host вызывается до общего объединения
+    if on_host:
+        for host, result in sorted(hosts.items()):
+            on_host(host, *result)
+    return merge_report_data(hosts.values(), cfg.get("MAX_URLS"))
+
+
+def load_checkpoint(path):
+    """
+    Читает состояние инкрементальной обработки, None если его нет или оно повреждено
+    """
+
+    try:
+        with open(path, "rb") as file:
+            return pickle.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, pickle.UnpicklingError) as error:
+        logger.error("Could not read checkpoint %s. %s", path, error)
+        return None
+
+
+def save_checkpoint(path, state):
+    """
+    Атомарно записывает состояние инкрементальной обработки
+    """
+
+    with atomic_open(path, "wb") as file:
+        pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def get_report_data_incremental(file_path, cfg):
+    """
+    Получает данные для отчета по растущему логу: разбирает только строки, дописанные
+    после прошлого запуска, и объединяет их с агрегатом, сохраненным в CHECKPOINT
+    """
+
+    stat = os.stat(file_path)
+    cfg = choose_extractor(file_path, cfg)
+    settings = {key: cfg.get(key) for key in AGGREGATION_KEYS}
+    state = load_checkpoint(cfg.get("CHECKPOINT"))
+    if state and not (state["path"] == os.path.abspath(file_path) and state["inode"] == stat.st_ino
+                      and state["settings"] == settings and state["offset"] <= stat.st_size):
+        logger.debug("checkpoint does not match %s, parsing from the beginning", file_path)
+        state = None
+
+    if file_path.endswith(".gz"):
+        # gzip-лог не дописывается и не читается с произвольного места, поэтому разбирается целиком,
+        # если изменился с прошлого запуска
+        offset = stat.st_size
+        if state and state["offset"] == offset:
+            result = state["data"]
         else:
-            report_data[url] = [float(time)]
+            result = get_report_data(file_path, cfg)
+    else:
+        start = state["offset"] if state else 0
+        offset = find_last_line_end(file_path, start, stat.st_size)
+        result = aggregate_range(file_path, start, offset, cfg)
+        if state:
+            result = merge_report_data([state["data"], result], cfg.get("MAX_URLS"))
+        logger.debug("parsed %s bytes of %s from offset %s", offset - start, file_path, start)
+
+    save_checkpoint(cfg.get("CHECKPOINT"), {
+        "path": os.path.abspath(file_path),
+        "inode": stat.st_ino,
+        "offset": offset,
+        "settings": settings,
+        "data": result,
+    })
+    return result
+
+
+def aggregates_path(cfg, date):
+    """
+    Возвращает путь к файлу агрегатов за дату рядом с отчетом
+    """
+
+    return os.path.join(cfg.get("REPORT_DIR"), f"report-{date}.agg")
+
+
+def save_aggregates(path, total_count, total_time, report_data, accuracy=DEFAULT_ACCURACY):
+    """
+    Сохраняет компактные объединяемые агрегаты по url в колоночный файл: count/sum/max
+    и корзины гистограммы QuantileSketch при любом AGGREGATION. Точные времена режима exact
+    переводятся в sketch с точностью accuracy, поэтому размер файла зависит от числа url
+    и разброса времен, а не от числа запросов
+    """
+
+    urls = list(report_data)
+    sketches = [timings if isinstance(timings, QuantileSketch) else QuantileSketch.from_values(timings, accuracy)
+                for timings in report_data.values()]
+    meta = {"total_count": total_count, "total_time": total_time, "mode": "approximate",
+            "accuracy": sketches[0].accuracy if sketches else accuracy}
+    columns = [
+        ("url", columnar.STR, [urls]),
+        ("count", "q", [[sketch.count for sketch in sketches]]),
+        ("total", "d", [[sketch.total for sketch in sketches]]),
+        ("max", "d", [[sketch.max for sketch in sketches]]),
+        ("zeros", "q", [[sketch.zeros for sketch in sketches]]),
+        ("bins", "q", [[len(sketch.bins) for sketch in sketches]]),
+        ("bin_index", "q", (sketch.bins.keys() for sketch in sketches)),
+        ("bin_count", "q", (sketch.bins.values() for sketch in sketches)),
+    ]
+    columnar.write_columns(path, columns, meta)
+    logger.debug("Saved aggregates. Path: %s", path)
+
+
+def load_aggregates(path):
+    """
+    Читает агрегаты, сохраненные save_aggregates, возвращает (total_count, total_time, report_data).
+    Файлы прежнего формата exact со всеми временами читаются как списки времен
+    """
+
+    meta, columns = columnar.read_columns(path)
+    report_data = {}
+    position = 0
+    if meta["mode"] == "approximate":
+        rows = zip(columns["url"], columns["count"], columns["total"], columns["max"],
+                   columns["zeros"], columns["bins"])
+        for url, count, total, time_max, zeros, bins in rows:
+            sketch = QuantileSketch(meta["accuracy"])
+            sketch.count, sketch.total, sketch.max, sketch.zeros = count, total, time_max, zeros
+            sketch.bins = dict(zip(columns["bin_index"][position:position + bins],
+                                   columns["bin_count"][position:position + bins]))
+            position += bins
+            report_data[url] = sketch
+    else:
+        for url, count in zip(columns["url"], columns["count"]):
+            report_data[url] = columns["times"][position:position + count]
+            position += count
+    return meta["total_count"], meta["total_time"], report_data
+
+
+def parse_period(period):
+    """
+    Разбирает период сводного отчета: YYYYMM - месяц, YYYY-Www - неделя ISO,
+    YYYYMMDD..YYYYMMDD - диапазон дат. Возвращает первую и последнюю дату
+    """
+
+    if '..' in period:
+        first, last = (datetime.strptime(value, "%Y%m%d").date() for value in period.split('..', 1))
+    elif '-W' in period:
+        year, week = period.split('-W', 1)
+        first = datetime.fromisocalendar(int(year), int(week), 1).date()
+        last = first + timedelta(days=6)
+    else:
+        first = datetime.strptime(period, "%Y%m").date()
+        last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    if first > last:
+        raise ValueError(f"empty period: {period}")
+    return first, last
+
+
+def rollup(cfg, period):
+    """
+    Строит сводный отчет report-<period>.html за неделю, месяц или диапазон дат,
+    объединяя сохраненные дневные агрегаты без чтения логов
+    """
+
+    first, last = parse_period(period)
+    paths = []
+    day = first
+    while day <= last:
+        path = aggregates_path(cfg, day.strftime("%Y%m%d"))
+        if os.path.exists(path):
+            paths.append(path)
+        else:
+            logger.warning("no aggregates for %s. Path: %s", day, path)
+        day += timedelta(days=1)
+    if not paths:
+        logger.error("no aggregates for period %s", period)
+        return None
+
+    # файлы прежнего формата exact со всеми временами переводятся в sketch точности остальных дней
+    accuracies = {meta["accuracy"] for meta in map(columnar.read_meta, paths) if meta["mode"] == "approximate"}
+    if len(accuracies) > 1:
+        raise ValueError(f"aggregates for {period} have different SKETCH_ACCURACY: {sorted(accuracies)}")
+
+    def loaded():
+        for path in paths:
+            total_count, total_time, report_data = load_aggregates(path)
+            if accuracies:
+                report_data = {
+                    url: timings if isinstance(timings, QuantileSketch)
+                    else QuantileSketch.from_values(timings, *accuracies)
+                    for url, timings in report_data.items()
+                }
+            yield total_count, total_time, report_data
+
+    total_count, total_time, report_data = merge_report_data(loaded(), cfg.get("MAX_URLS"))
+    report = create_report(total_count, total_time, report_data, cfg.get("REPORT_SIZE"), cfg.get("PERCENTILES") or ())
+    write_reports(cfg, period.replace('..', '-'), report)
     return total_count, total_time, report_data
 
 
-def create_report(total_count, total_time, report_data):
+def time_stats(timings, percentiles=()):
+    """
+    Возвращает count, sum, max и медиану времен одного url, а за ними - значения percentiles
+    (в процентах, с линейной интерполяцией между соседними рангами). Все порядковые статистики
+    считаются одним проходом: одна сортировка, один numpy.partition или один обход гистограммы
+    """
+
+    qs = [percentile / 100 for percentile in percentiles]
+    if isinstance(timings, QuantileSketch):
+        time_med, *quantiles = timings.quantiles([0.5, *qs])
+        return (timings.count, timings.total, timings.max, time_med, *quantiles)
+    count = len(timings)
+    if numpy is None or count < NUMPY_MIN_SIZE:
+        if not qs:
+            return count, sum(timings), max(timings), median(timings)
+        values = sorted(timings)
+        return (count, sum(values), values[-1], median(values),
+                *(interpolate_rank(values, q * (count - 1)) for q in qs))
+    values = numpy.frombuffer(timings) if isinstance(timings, array) else numpy.asarray(timings, dtype=float)
+    middle = count // 2
+    positions = [q * (count - 1) for q in qs]
+    kth = {middle - 1 + count % 2, middle}
+    for position in positions:
+        kth.update((math.floor(position), math.ceil(position)))
+    partitioned = numpy.partition(values, sorted(kth))
+    if count % 2:
+        time_med = partitioned[middle]
+    else:
+        time_med = (partitioned[middle - 1] + partitioned[middle]) / 2
+    return (count, float(values.sum()), float(values.max()), float(time_med),
+            *(float(interpolate_rank(partitioned, position)) for position in positions))
+
+
+def interpolate_rank(values, position):
+    """
+    Возвращает значение дробного ранга position по упорядоченным (на нужных рангах) values
+    """
+
+    lower = math.floor(position)
+    if position == lower:
+        return values[lower]
+    return values[lower] + (values[lower + 1] - values[lower]) * (position - lower)
+
+
+def timings_sum(timings):
     """
-    Создает отчет
+    Возвращает суммарное время запросов url без расчета остальной статистики
     """
 
-    for url, time_list in report_data.items():
-        time_sum = sum(time_list)
+    if isinstance(timings, QuantileSketch):
+        return timings.total
+    if numpy is not None and len(timings) >= NUMPY_MIN_SIZE:
+        values = numpy.frombuffer(timings) if isinstance(timings, array) else numpy.asarray(timings, dtype=float)
+        return float(values.sum())
+    return sum(timings)
+
+
+def select_top(report_data, size):
+    """
+    Выбирает size url с наибольшим суммарным временем за O(n log size), по убыванию времени
+    """
+
+    return heapq.nlargest(size, report_data.items(), key=lambda item: timings_sum(item[1]))
+
+
+def create_report(total_count, total_time, report_data, size=None, percentiles=()):
+    """
+    Создает отчет. Если задан size, статистика считается только для size url
+    с наибольшим time_sum, строки идут по убыванию time_sum.
+    Для каждого p из percentiles в строку добавляется time_p<p>
+    """
+
+    for percentile in percentiles:
+        if not 0 <= percentile <= 100:
+            raise ValueError(f"percentile must be between 0 and 100: {percentile}")
+    percentile_keys = [f"time_p{percentile:g}" for percentile in percentiles]
+    items = report_data.items() if size is None else select_top(report_data, size)
+    for url, timings in items:
+        count, time_sum, time_max, time_med, *quantiles = time_stats(timings, percentiles)
         row = {
             'url': url,
-            'count': len(time_list),
-            'count_perc': 100 * len(time_list) / total_count,
-            'time_avg': time_sum / len(time_list),
-            'time_max': max(time_list),
-            'time_med': median(time_list),
+            'count': count,
+            'count_perc': 100 * count / total_count,
+            'time_avg': time_sum / count,
+            'time_max': time_max,
+            'time_med': time_med,
             'time_perc': 100 * time_sum / total_time,
             'time_sum': time_sum,
         }
+        row.update(zip(percentile_keys, quantiles))
         yield row
 
 
+@lru_cache(maxsize=None)
+def load_template(path=REPORT_TEMPLATE):
+    """
+    Читает шаблон отчета один раз и делит его на части до и после TABLE_PLACEHOLDER
+    """
+
+    with open(path, "r", encoding="utf-8") as report_template:
+        head, placeholder, tail = report_template.read().partition(TABLE_PLACEHOLDER)
+    if not placeholder:
+        raise ValueError(f"{TABLE_PLACEHOLDER} not found in report template {path}")
+    return head, tail
+
+
+def dump_rows(rows):
+    """
+    Потоково сериализует строки отчета в JSON-массив. "</" экранируется,
+    чтобы url вида </script> не закрывал тег скрипта в html
+    """
+
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    yield "["
+    for number, row in enumerate(rows):
+        if number:
+            yield ","
+        yield encode(row).replace("</", "<\\/")
+    yield "]"
+
+
 def render_report(cfg, date, report):
     """
-    Создает html страницу с отчетом
+    Создает html страницу с отчетом: строки пишутся в файл по одной, без сборки всей страницы
+    в памяти, во временный файл в REPORT_DIR, который затем атомарно переименовывается
     """
 
-    with open("./reports/report.html", "r", encoding="utf-8") as report_template:
-        template = Template(report_template.read())
-        sorted_report = sorted(list(report), key=itemgetter('time_sum'), reverse=True)
-        result = template.safe_substitute(table_json=sorted_report[0:cfg.get("REPORT_SIZE")])
-        file_path = os.path.join(cfg.get("REPORT_DIR"), f"report-{date}.html")
-        with open(file_path, "w", encoding="utf-8") as report_file:
-            report_file.write(result)
-        logger.debug("Complete render report. Path: %s", file_path)
+    head, tail = load_template()
+    sorted_report = heapq.nlargest(cfg.get("REPORT_SIZE"), report, key=itemgetter('time_sum'))
+    file_path = os.path.join(cfg.get("REPORT_DIR"), f"report-{date}.html")
+    with atomic_open(file_path, encoding="utf-8") as report_file:
+        report_file.write(head)
+        report_file.writelines(dump_rows(sorted_report))
+        report_file.write(tail)
+    logger.debug("Complete render report. Path: %s", file_path)
+
+
+def write_reports(cfg, name, report):
+    """
+    Записывает отчет report-<name> во всех форматах из REPORT_FORMATS
+    """
+
+    report = heapq.nlargest(cfg.get("REPORT_SIZE"), report, key=itemgetter('time_sum'))
+    for report_format in cfg.get("REPORT_FORMATS") or ("html",):
+        if report_format == "html":
+            render_report(cfg, name, report)
+        else:
+            file_path = writers.report_path(cfg.get("REPORT_DIR"), name, report_format)
+            writers.write_report(report_format, file_path, report)
+            logger.debug("Complete %s report. Path: %s", report_format, file_path)
+
+
+def report_index(cfg):
+    """
+    Возвращает индекс дат, за которые построен отчет в первом из REPORT_FORMATS
+    """
+
+    report_format = (cfg.get("REPORT_FORMATS") or ("html",))[0]
+    return discovery.ReportIndex(cfg.get("REPORT_DIR"), writers.SUFFIXES[report_format])
+
+
+def build_report(cfg, date, file_path, instrumented=False):
+    """
+    Строит отчеты report-<date> по логу и сохраняет агрегаты.
+    Возвращает число разобранных строк и различных url
+    """
+
+    with stage("get_report_data", instrumented) as fields:
+        if cfg.get("INCREMENTAL"):
+            # отчет по растущему логу перестраивается на каждом запуске
+            result = get_report_data_incremental(file_path, cfg)
+        else:
+            result = get_report_data(file_path, cfg)
+        fields.update(path=file_path, bytes=os.path.getsize(file_path), lines=result[0], urls=len(result[2]))
+    return publish_report(cfg, date, result, instrumented)
+
+
+def publish_report(cfg, name, result, instrumented=False):
+    """
+    Сохраняет агрегаты и записывает отчеты report-<name> по результату get_report_data,
+    а если в нем есть timeline, - и разбивку по времени. Возвращает число разобранных строк и различных url
+    """
+
+    total_count, total_time, report_data, *timeline = result
+    if cfg.get("SAVE_AGGREGATES"):
+        with stage("save_aggregates", instrumented):
+            save_aggregates(aggregates_path(cfg, name), total_count, total_time, report_data,
+                            cfg.get("SKETCH_ACCURACY", DEFAULT_ACCURACY))
+    with stage("create_report", instrumented) as fields:
+        report = list(create_report(total_count, total_time, report_data, cfg.get("REPORT_SIZE"),
+                                    cfg.get("PERCENTILES") or ()))
+        fields.update(rows=len(report))
+    with stage("write_reports", instrumented):
+        write_reports(cfg, name, report)
+    if timeline:
+        with stage("write_timeline", instrumented):
+            write_timeline(cfg, name, timeline[0], {row["url"] for row in report})
+    return total_count, len(report_data)
+
+
+def write_timeline(cfg, name, timeline, urls):
+    """
+    Записывает разбивку по интервалам времени для url из urls (строк отчета)
+    в report-<name>-timeline в формате TIMELINE_FORMAT
+    """
+
+    percentiles = cfg.get("PERCENTILES") or ()
+    percentile_keys = [f"time_p{percentile:g}" for percentile in percentiles]
+    rows = []
+    for (label, url), cell in sorted(timeline.items()):
+        if url not in urls:
+            continue
+        count, time_sum, time_max, time_med, *quantiles = time_stats(cell, percentiles)
+        row = {
+            'bucket': label,
+            'url': url,
+            'count': count,
+            'time_avg': time_sum / count,
+            'time_max': time_max,
+            'time_med': time_med,
+            'time_sum': time_sum,
+        }
+        row.update(zip(percentile_keys, quantiles))
+        rows.append(row)
+    report_format = cfg.get("TIMELINE_FORMAT") or "jsonl"
+    file_path = writers.report_path(cfg.get("REPORT_DIR"), f"{name}-timeline", report_format)
+    writers.write_report(report_format, file_path, rows)
+    logger.debug("Complete timeline. Path: %s", file_path)
 
 
 def main(cfg):
@@ -171,22 +1410,172 @@ def main(cfg):
     Основная функция
     """
 
-    date, filename = find_last_date_log(cfg.get("LOG_DIR"))
-    report_path = os.path.join(cfg.get("REPORT_DIR"), f"report-{date}.html")
-    if check_exist_report(date, cfg.get("REPORT_DIR")):
-        logger.error("last date log report already exists. Path: %s", report_path)
-        sys.exit()
-    file_path = os.path.join(cfg.get('LOG_DIR'), filename)
-    total_count, total_time, report_data = get_report_data(file_path)
-    report = create_report(total_count, total_time, report_data)
-    render_report(cfg, date, report)
+    last_log = discovery.find_last_log(cfg.get("LOG_DIR"))
+    if not last_log:
+        logger.info("no logs found in %s", cfg.get("LOG_DIR"))
+        return
+    date, file_path = f"{last_log.date:%Y%m%d}", last_log.path
+    index = report_index(cfg)
+    if not cfg.get("INCREMENTAL"):
+        if last_log.date in index:
+            logger.error("last date log report already exists. Path: %s",
+                         os.path.join(index.report_dir, discovery.report_name(last_log.date, index.suffix)))
+            sys.exit()
+    # время стадий пишется в лог, только если включен прогресс или профилирование
+    instrumented = bool(cfg.get("PROGRESS") or cfg.get("PROFILE"))
+    try:
+        build_report(cfg, date, file_path, instrumented)
+    except ErrorThresholdExceeded as error:
+        logger.error("Parsing of %s aborted: %s", file_path, error)
+        sys.exit(1)
+    index.add(last_log.date)
+
+
+def inputs_report_name(paths):
+    """
+    Возвращает имя отчета по нескольким логам: дату из имен логов или диапазон дат FROM-TO
+    """
+
+    dates = {discovery.parse_name_date(os.path.basename(path), discovery.LOG_NAME_PATTERN) for path in paths}
+    if not dates or None in dates:
+        raise ValueError("input logs must be named nginx-access-ui.log-YYYYMMDD(.gz)")
+    first, last = min(dates), max(dates)
+    return f"{first:%Y%m%d}" if first == last else f"{first:%Y%m%d}-{last:%Y%m%d}"
+
+
+def main_inputs(cfg):
+    """
+    Строит общий отчет по логам из INPUT (пути и glob-шаблоны), а с PER_HOST - еще и отчеты
+    report-<name>-<host> по каждому хосту
+    """
+
+    paths = expand_inputs(cfg.get("INPUT"))
+    if not paths:
+        logger.info("no logs found for %s", cfg.get("INPUT"))
+        return
+    name = inputs_report_name(paths)
+    instrumented = bool(cfg.get("PROGRESS") or cfg.get("PROFILE"))
+
+    def on_host(host, *host_result):
+        publish_report(cfg, f"{name}-{host}", host_result, instrumented)
+
+    try:
+        with stage("get_report_data", instrumented) as fields:
+            result = get_report_data_multi(paths, cfg, on_host if cfg.get("PER_HOST") else None)
+            fields.update(files=len(paths), bytes=sum(map(os.path.getsize, paths)), lines=result[0],
+                          urls=len(result[2]))
+    except ErrorThresholdExceeded as error:
+        logger.error("Parsing of %s aborted: %s", cfg.get("INPUT"), error)
+        sys.exit(1)
+    publish_report(cfg, name, result, instrumented)
+    if '-' not in name:
+        report_index(cfg).add(datetime.strptime(name, "%Y%m%d").date())
+
+
+def backfill_log(cfg, log):
+    """
+    Строит отчет по одному логу (выполняется в процессе пула backfill). Возвращает сводку по файлу
+    """
+
+    start = perf_counter()
+    # параллельность backfill - по файлам, поэтому каждый лог разбирается в одном процессе
+    lines, urls = build_report({**cfg, "WORKERS": 1, "INCREMENTAL": False}, f"{log.date:%Y%m%d}", log.path)
+    seconds = max(perf_counter() - start, 1e-9)
+    size = os.path.getsize(log.path)
+    return {
+        "date": f"{log.date:%Y%m%d}",
+        "path": log.path,
+        "bytes": size,
+        "lines": lines,
+        "urls": urls,
+        "seconds": round(seconds, 3),
+        "lines_per_sec": round(lines / seconds),
+        "mb_per_sec": round(size / seconds / 2 ** 20, 2),
+    }
+
+
+def backfill(cfg, period):
+    """
+    Строит отчеты за все даты периода, для которых есть лог, но нет отчета.
+    Логи разбираются параллельно в WORKERS процессах, по одному логу на процесс.
+    Возвращает сводки по обработанным файлам
+    """
+
+    first, last = parse_period(period)
+    index = report_index(cfg)
+    # на одну дату может быть и plain, и gzip-лог: отчет строится по одному из них
+    logs = {log.date: log for log in discovery.find_logs(cfg.get("LOG_DIR"), first, last) if log.date not in index}
+    if not logs:
+        logger.info("no logs without reports for period %s", period)
+        return []
+
+    start = perf_counter()
+    summary = []
+    failed = 0
+    with ProcessPoolExecutor(max_workers=min(cfg.get("WORKERS") or 1, len(logs))) as executor:
+        futures = {executor.submit(backfill_log, cfg, log): log for log in logs.values()}
+        for future in as_completed(futures):
+            log = futures[future]
+            try:
+                result = future.result()
+            except ErrorThresholdExceeded as error:
+                logger.error("Parsing of %s aborted: %s", log.path, error)
+                failed += 1
+                continue
+            # ошибка одного файла (битый gzip, ошибка чтения) не должна останавливать остальные
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Report for %s failed", log.path)
+                failed += 1
+                continue
+            index.add(log.date)
+            log_event("backfill_file", **result)
+            summary.append(result)
+
+    seconds = max(perf_counter() - start, 1e-9)
+    lines = sum(result["lines"] for result in summary)
+    log_event("backfill", period=period, files=len(summary), failed=failed, lines=lines,
+              bytes=sum(result["bytes"] for result in summary), seconds=round(seconds, 3),
+              lines_per_sec=round(lines / seconds))
+    return sorted(summary, key=itemgetter("date"))
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="log_analyzer")
     parser.add_argument("--config", dest="config_path")
+    parser.add_argument("--workers", type=int, help="number of parsing processes")
+    parser.add_argument("--incremental", action="store_true", help="parse only new lines of a growing log")
+    parser.add_argument("--backfill", metavar="FROM..TO",
+                        help="build missing daily reports for YYYYMMDD..YYYYMMDD in WORKERS processes")
+    parser.add_argument("--input", nargs="+", metavar="LOG",
+                        help="build one report from several logs or glob patterns, e.g. 'log/*/*-20170630.gz'")
+    parser.add_argument("--per-host", action="store_true", help="with --input also build a report for each host")
+    parser.add_argument("--progress", action="store_true",
+                        help="log parsing progress and stage timings as JSON")
+    parser.add_argument("--profile", metavar="PATH", help="dump cProfile stats of the run to PATH")
+    parser.add_argument("--rollup", metavar="PERIOD",
+                        help="build a report from saved aggregates for YYYYMM, YYYY-Www or YYYYMMDD..YYYYMMDD")
     args = parser.parse_args()
     logger.debug(args)
     config_path = os.path.join('./config', args.config_path if args.config_path else 'config.json')
     config = load_config(config_path, default_config)
-    main(config)
+    if args.workers:
+        config["WORKERS"] = args.workers
+    if args.incremental:
+        config["INCREMENTAL"] = True
+    if args.input:
+        config["INPUT"] = args.input
+    if args.per_host:
+        config["PER_HOST"] = True
+    if args.progress:
+        config["PROGRESS"] = True
+    if args.profile:
+        config["PROFILE"] = args.profile
+    with profile(config.get("PROFILE")):
+        if args.rollup:
+            rollup(config, args.rollup)
+        elif args.backfill:
+            backfill(config, args.backfill)
+        elif config.get("INPUT"):
+            main_inputs(config)
+        else:
+            main(config)
@@ -0,0 +1,141 @@
+"""
+Потоковый агрегат времен запросов с приближенными квантилями
+"""
+import math
+
+# относительная погрешность квантилей по умолчанию
+DEFAULT_ACCURACY = 0.01
+# значения не больше этого порога (0.000 в логе) считаются нулевыми
+MIN_VALUE = 1e-9
+
+
+class QuantileSketch:
+    """
+    Хранит count/sum/max и логарифмическую гистограмму значений (как в DDSketch).
+    Значение x попадает в корзину i = ceil(log(x) / log(gamma)), gamma = (1 + a) / (1 - a),
+    поэтому оценка каждого элемента выборки, а значит и интерполированного между
+    ними квантиля, отличается от точного значения не больше, чем на a * значение.
+    Число корзин ограничено диапазоном значений, а не числом запросов:
+    для 1 мс..10000 с при a = 0.01 это не больше ~800 корзин.
+    """
+
+    __slots__ = ('accuracy', 'count', 'total', 'max', 'zeros', 'bins', '_gamma', '_log_gamma')
+
+    def __init__(self, accuracy=DEFAULT_ACCURACY):
+        if not 0 < accuracy < 1:
+            raise ValueError(f"accuracy must be in (0, 1), got {accuracy}")
+        self.accuracy = accuracy
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.zeros = 0
+        self.bins = {}
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self._gamma)
+
+    @classmethod
+    def from_values(cls, values, accuracy=DEFAULT_ACCURACY):
+        """
+        Строит агрегат по готовой выборке
+        """
+
+        sketch = cls(accuracy)
+        for value in values:
+            sketch.append(value)
+        return sketch
+
+    def __len__(self):
+        return self.count
+
+    def __getstate__(self):
+        return self.accuracy, self.count, self.total, self.max, self.zeros, self.bins
+
+    def __setstate__(self, state):
+        accuracy, self.count, self.total, self.max, self.zeros, self.bins = state
+        self.accuracy = accuracy
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self._gamma)
+
+    def append(self, value):
+        """
+        Добавляет значение
+        """
+
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if value <= MIN_VALUE:
+            self.zeros += 1
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[index] = self.bins.get(index, 0) + 1
+
+    def __iadd__(self, other):
+        """
+        Объединяет с агрегатом, посчитанным по другой части лога
+        """
+
+        if other.accuracy != self.accuracy:
+            raise ValueError("cannot merge sketches with different accuracy")
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.zeros += other.zeros
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        return self
+
+    def quantile(self, q):
+        """
+        Возвращает приближенный q-квантиль (0 <= q <= 1) с линейной интерполяцией
+        между соседними рангами, как statistics.median для q = 0.5
+        """
+
+        return self.quantiles((q,))[0]
+
+    def quantiles(self, qs):
+        """
+        Возвращает приближенные квантили для всех q из qs за один проход по корзинам
+        """
+
+        if not self.count:
+            raise ValueError("quantile of empty sketch")
+        positions = [q * (self.count - 1) for q in qs]
+        ranks = set()
+        for position in positions:
+            ranks.update((math.floor(position), math.ceil(position)))
+        values = self._values_at(ranks)
+        result = []
+        for position in positions:
+            lower = values[math.floor(position)]
+            result.append(lower + (values[math.ceil(position)] - lower) * (position - math.floor(position)))
+        return result
+
+    def _values_at(self, ranks):
+        """
+        Возвращает оценки элементов выборки с рангами ranks (с нуля): {ранг: значение}
+        """
+
+        values = {}
+        pending = sorted(ranks)
+        seen = self.zeros
+        while pending and pending[0] < seen:
+            values[pending.pop(0)] = 0.0
+        for index in sorted(self.bins):
+            if not pending:
+                break
+            seen += self.bins[index]
+            value = min(2 * self._gamma ** index / (self._gamma + 1), self.max)
+            while pending and pending[0] < seen and pending[0] < self.count - 1:
+                values[pending.pop(0)] = value
+        # последний ранг - точный максимум
+        values.update(dict.fromkeys(pending, self.max))
+        return values
+
+    def median(self):
+        """
+        Возвращает приближенную медиану
+        """
+
+        return self.quantile(0.5)
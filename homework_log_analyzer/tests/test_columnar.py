@@ -0,0 +1,68 @@
+"""
+Модуль тестирования columnar
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from array import array
+
+import columnar
+
+
+class TestColumnar(unittest.TestCase):
+    """
+    Класс TestColumnar
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.path = os.path.join(self.tmp_dir, "data.col")
+
+    def test_write_read_columns(self):
+        """
+        Тестирование записи и чтения колонок, записанных частями
+        """
+
+        columnar.write_columns(self.path, [
+            ("url", columnar.STR, [["/api/v2/banner/1", "/ü"], [""]]),
+            ("count", "q", [array("q", [2, 1]), [3]]),
+            ("times", "d", [[0.1, 0.2], [], [0.3]]),
+        ], {"total_count": 3})
+        meta, columns = columnar.read_columns(self.path)
+        self.assertEqual(meta, {"total_count": 3})
+        self.assertEqual(columnar.read_meta(self.path), meta)
+        self.assertEqual(columns["url"], ["/api/v2/banner/1", "/ü", ""])
+        self.assertEqual(columns["count"], array("q", [2, 1, 3]))
+        self.assertEqual(columns["times"], array("d", [0.1, 0.2, 0.3]))
+
+    def test_write_atomic(self):
+        """
+        Тестирование атомарной записи: файл читается всеми, а при ошибке не остается временных файлов
+        """
+
+        columnar.write_columns(self.path, [("count", "q", [[1]])])
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o644)
+        with self.assertRaises(TypeError):
+            columnar.write_columns(os.path.join(self.tmp_dir, "broken.col"), [("count", "q", [["x"]])])
+        self.assertEqual(os.listdir(self.tmp_dir), ["data.col"])
+
+    def test_not_columnar(self):
+        """
+        Тестирование чтения постороннего и обрезанного файла
+        """
+
+        with open(self.path, "wb") as file:
+            file.write(b"<html></html>")
+        with self.assertRaises(columnar.ColumnarFormatError):
+            columnar.read_columns(self.path)
+        with open(self.path, "wb") as file:
+            file.write(columnar.MAGIC + b"\0" * 32)
+        with self.assertRaises(columnar.ColumnarFormatError):
+            columnar.read_meta(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
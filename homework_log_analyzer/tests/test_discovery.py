@@ -0,0 +1,79 @@
+"""
+Модуль тестирования discovery
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date
+
+import discovery
+
+
+def touch(path):
+    """
+    Создает пустой файл
+    """
+
+    with open(path, "w", encoding="utf-8"):
+        pass
+
+
+class TestDiscovery(unittest.TestCase):
+    """
+    Класс TestDiscovery
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def test_find_last_log(self):
+        """
+        Тестирование find_last_log и find_logs
+        """
+
+        for name in ("nginx-access-ui.log-20170630.gz", "nginx-access-ui.log-20170629",
+                     "nginx-access-ui.log-20171340", "nginx-access-ui.log-20180101.bz2",
+                     "nginx-access-ui.log-20180101.gz.tmp", "apache.log-20190101"):
+            touch(os.path.join(self.tmp_dir, name))
+        os.mkdir(os.path.join(self.tmp_dir, "nginx-access-ui.log-20190101"))
+
+        last_log = discovery.find_last_log(self.tmp_dir)
+        self.assertEqual(last_log.date, date(2017, 6, 30))
+        self.assertEqual(last_log.path, os.path.join(self.tmp_dir, "nginx-access-ui.log-20170630.gz"))
+        logs = discovery.find_logs(self.tmp_dir, date(2017, 6, 1), date(2017, 6, 29))
+        self.assertEqual([log.date for log in logs], [date(2017, 6, 29)])
+        self.assertIsNone(discovery.find_last_log(os.path.join(self.tmp_dir, "nginx-access-ui.log-20190101")))
+
+    def test_report_index(self):
+        """
+        Тестирование ReportIndex
+        """
+
+        touch(os.path.join(self.tmp_dir, "report-20170629.html"))
+        touch(os.path.join(self.tmp_dir, "report-201706.html"))
+        index = discovery.ReportIndex(self.tmp_dir)
+        self.assertEqual(index.dates, {date(2017, 6, 29)})
+        # индекс пишется через atomic_open: без временных файлов и с обычными правами
+        self.assertEqual(os.stat(index.path).st_mode & 0o777, 0o644)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)),
+                         sorted(["report-20170629.html", "report-201706.html", os.path.basename(index.path)]))
+
+        touch(os.path.join(self.tmp_dir, "report-20170630.html"))
+        index.add(date(2017, 6, 30))
+        self.assertIn(date(2017, 6, 30), discovery.ReportIndex(self.tmp_dir))
+
+        os.remove(os.path.join(self.tmp_dir, "report-20170629.html"))
+        self.assertNotIn(date(2017, 6, 29), index)
+        self.assertEqual(discovery.ReportIndex(self.tmp_dir).dates, {date(2017, 6, 30)})
+
+        with open(index.path, "w", encoding="utf-8") as file:
+            file.write("{")
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(discovery.ReportIndex(self.tmp_dir).dates, {date(2017, 6, 30)})
+
+
+if __name__ == '__main__':
+    unittest.main()
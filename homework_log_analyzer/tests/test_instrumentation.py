@@ -0,0 +1,67 @@
+"""
+Модуль тестирования instrumentation
+"""
+
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+from instrumentation import Progress, profile, stage
+
+
+class TestInstrumentation(unittest.TestCase):
+    """
+    Класс TestInstrumentation
+    """
+
+    def test_stage(self):
+        """
+        Тестирование stage
+        """
+
+        with self.assertLogs(level="INFO") as logs:
+            with stage("parse") as fields:
+                fields["lines"] = 10
+        event = json.loads(logs.records[0].getMessage())
+        self.assertEqual(event["event"], "stage")
+        self.assertEqual(event["stage"], "parse")
+        self.assertEqual(event["lines"], 10)
+        self.assertGreaterEqual(event["seconds"], 0)
+
+        with self.assertNoLogs(level="INFO"):
+            with stage("parse", enabled=False):
+                pass
+
+    def test_progress(self):
+        """
+        Тестирование Progress
+        """
+
+        progress = Progress("log", total_bytes=100, interval=3600)
+        progress.bytes_read = 50
+        with self.assertNoLogs(level="INFO"):
+            progress.update(5, 2)
+        with self.assertLogs(level="INFO") as logs:
+            progress.update(10, 3, force=True)
+        event = json.loads(logs.records[0].getMessage())
+        self.assertEqual((event["lines"], event["bytes"], event["total_bytes"], event["urls"]), (10, 50, 100, 3))
+
+    def test_profile(self):
+        """
+        Тестирование profile
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, "run.prof")
+        with self.assertLogs(level="INFO"):
+            with profile(path):
+                sorted(range(1000), key=str)
+        self.assertTrue(pstats.Stats(path).total_calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,8 +2,19 @@
 Модуль тестирования
 """
 
+import gzip
+import json
 import os
+import random
+import shutil
+import tempfile
 import unittest
+from array import array
+from collections import Counter
+from datetime import date
+from statistics import median
+
+import columnar
 import log_analyzer
 
 config = {
@@ -27,6 +38,21 @@ class TestLogAnalyzer(unittest.TestCase):
         self.assertTrue(last_date > '20170629')
         self.assertTrue(last_date < '20170631')
 
+    def test_check_exist_report(self):
+        """
+        Тестирование check_exist_report
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.assertEqual(log_analyzer.find_last_date_log(tmp_dir), ('', ''))
+        self.assertFalse(log_analyzer.check_exist_report('', tmp_dir))
+        with open(os.path.join(tmp_dir, "report-20170630.html"), "w", encoding="utf-8"):
+            pass
+        self.assertTrue(log_analyzer.check_exist_report('20170630', tmp_dir))
+        self.assertFalse(log_analyzer.check_exist_report('20170630', tmp_dir, "csv"))
+        self.assertFalse(log_analyzer.check_exist_report('20170629', tmp_dir))
+
     def test_read_lines(self):
         """
         Тестирование  read_lines
@@ -74,6 +100,574 @@ class TestLogAnalyzer(unittest.TestCase):
             ('/api/v2/banner/25019354', '0.390')
         )
 
+    def test_process_line_not_matched(self):
+        """
+        Тестирование process_line на строке другого формата
+        """
+
+        self.assertIsNone(log_analyzer.process_line('not a nginx log line'))
+        self.assertIsNone(log_analyzer.process_line(''))
+
+    def test_bad_request_time(self):
+        """
+        Тестирование строк с пустым или нечисловым request_time: они считаются ошибками разбора
+        """
+
+        good_line = '1.196.116.32 -  - [29/Jun/2017:03:50:22 +0300] "GET /api/v2/banner/25019354 HTTP/1.1" ' \
+                    '200 927 "-" "Lynx/2.8.8dev.9" "-" "1498697422-2190034393-4708-9752759" "dc7161be3" 0.390\n'
+        bad_lines = [good_line.replace(' 0.390', ' '), good_line.replace(' 0.390', ' -'),
+                     good_line.replace(' 0.390', ' 0.3x')]
+        for line in bad_lines:
+            self.assertIsNone(log_analyzer.process_line(line))
+            for name in log_analyzer.EXTRACTORS:
+                self.assertIsNone(log_analyzer.make_extractor(name=name).parse(line.encode()))
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, "nginx-access-ui.log-20170101")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(good_line * 20 + "".join(bad_lines))
+        for cfg in ({}, {"EXTRACTOR": "split"}, {"WORKERS": 2}):
+            total_count, _, report_data = log_analyzer.get_report_data(path, {"ERROR_THRESHOLD": 0.5, **cfg})
+            self.assertEqual(total_count, 20)
+            self.assertEqual(len(report_data), 1)
+            with self.assertRaises(log_analyzer.ErrorThresholdExceeded):
+                log_analyzer.get_report_data(path, {"ERROR_THRESHOLD": 0.1, **cfg})
+
+    def test_read_chunk_truncated_lines(self):
+        """
+        Тестирование read_chunk на логе с обрезанными строками: записи и счетчики строк
+        совпадают с построчным разбором
+        """
+
+        with open(test_log_path, "rb") as file:
+            good = file.readline()
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, "nginx-access-ui.log-20170101")
+        rng = random.Random(1)
+        cases = [[good, good[:40] + b'"GET /b\n', good]]
+        cases += [[good[:rng.randrange(1, len(good) - 1)] + b"\n" if rng.random() < 0.4 else good
+                   for _ in range(rng.randrange(1, 6))] for _ in range(300)]
+        for lines in cases:
+            with open(path, "wb") as file:
+                file.write(b"".join(lines))
+            expected = [log_analyzer.process_line_bytes(line) for line in lines]
+            counts = Counter()
+            records = list(log_analyzer.read_chunk(path, counts=counts))
+            self.assertEqual(records, [record for record in expected if record], lines)
+            self.assertEqual(counts, {"total": len(lines), "failed": expected.count(None)}, lines)
+
+    def test_compile_log_format(self):
+        """
+        Тестирование compile_log_format
+        """
+
+        pattern = log_analyzer.compile_log_format('$remote_addr [$time_local] "$request" $request_time')
+        search_matches = pattern.match('1.1.1.1 [29/Jun/2017:03:59:15 +0300] "GET / HTTP/1.1" 0.5\n')
+        self.assertEqual(search_matches.groupdict(), {'url': '/', 'request': None, 'request_time': '0.5'})
+
+    def test_split_extractor(self):
+        """
+        Тестирование позиционного извлечения полей: результат совпадает с регулярным выражением
+        """
+
+        with open(test_log_path, "rb") as file:
+            lines = file.read().splitlines()
+        lines += [
+            b'1.1.1.1 -  - [29/Jun/2017:03:59:15 +0300] "GET /a b HTTP/1.1" 200 1 "-" "x" "-" "-" "-" 0.5',
+            b'1.1.1.1 -  - [29/Jun/2017:03:59:15 +0300] "0" 400 1 "-" "x" "-" "-" "-" 0.001\r',
+            b'1.1.1.1 -  - [29/Jun/2017:03:59:15 +0300] "GET /" 200',
+            b'',
+        ]
+        regex, split = (log_analyzer.make_extractor(name=name) for name in log_analyzer.EXTRACTORS)
+        self.assertEqual(list(map(split.parse, lines)), list(map(regex.parse, lines)))
+
+        log_format = '$remote_addr [$time_local] "$request" $status "$http_user_agent" $request_time'
+        line = b'1.1.1.1 [29/Jun/2017:03:59:15 +0300] "POST /api HTTP/1.0" 200 "Mozilla 5.0" 0.25'
+        self.assertEqual(log_analyzer.make_extractor(log_format, "split").parse(line), ("/api", "0.25"))
+        self.assertEqual(log_analyzer.make_extractor(log_format, "regex").parse(line), ("/api", "0.25"))
+        self.assertIsNone(log_analyzer.make_extractor('[$time_local $request_time] "$request"', "split"))
+        with self.assertRaises(ValueError):
+            log_analyzer.make_extractor(name="lexer")
+
+    def test_choose_extractor(self):
+        """
+        Тестирование выбора способа извлечения полей и разбора лога с LOG_FORMAT из config
+        """
+
+        cfg = log_analyzer.choose_extractor(test_log_path, {"EXTRACTOR": "auto"})
+        self.assertIn(cfg["EXTRACTOR"], log_analyzer.EXTRACTORS)
+        self.assertEqual(log_analyzer.choose_extractor(test_log_path, {"EXTRACTOR": "split"})["EXTRACTOR"], "split")
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, "nginx-access-ui.log-20170101")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write('1.1.1.1 [29/Jun/2017:03:59:15 +0300] "GET /a HTTP/1.1" 0.5\n' * 3)
+            file.write('1.1.1.1 [29/Jun/2017:03:59:15 +0300] "GET /b HTTP/1.1" 1.5\n')
+        log_format = '$remote_addr [$time_local] "$request" $request_time'
+        for name in ("auto", "regex", "split"):
+            total_count, total_time, report_data = log_analyzer.get_report_data(
+                path, {"LOG_FORMAT": log_format, "EXTRACTOR": name})
+            self.assertEqual((total_count, total_time), (4, 3.0))
+            self.assertEqual(sorted(report_data), ["/a", "/b"])
+
+    def test_split_file(self):
+        """
+        Тестирование split_file
+        """
+
+        with open(test_log_path, "rb") as file:
+            content = file.read()
+        chunks = log_analyzer.split_file(test_log_path, 4)
+        self.assertEqual(chunks[0][0], 0)
+        self.assertEqual(chunks[-1][1], len(content))
+        for start, _ in chunks[1:]:
+            self.assertEqual(content[start - 1:start], b"\n")
+
+    def test_get_report_data_workers(self):
+        """
+        Тестирование get_report_data в несколько процессов для plain и gzip логов
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        plain_path = os.path.join(tmp_dir, "nginx-access-ui.log-20170101")
+        with open(test_log_path, "rb") as src, open(plain_path, "wb") as dst:
+            dst.write((src.read().rstrip(b"\n") + b"\n") * 50)
+        with open(plain_path, "rb") as src, gzip.open(plain_path + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+
+        expected_count, expected_time, expected_data = log_analyzer.get_report_data(plain_path)
+        for path in (plain_path, plain_path + ".gz"):
+            total_count, total_time, report_data = log_analyzer.get_report_data(path, {"WORKERS": 3})
+            self.assertEqual(total_count, expected_count)
+            self.assertAlmostEqual(total_time, expected_time)
+            self.assertEqual({url: sorted(times) for url, times in report_data.items()},
+                             {url: sorted(times) for url, times in expected_data.items()})
+
+    def test_get_report_data_approximate(self):
+        """
+        Тестирование get_report_data в режиме approximate
+        """
+
+        exact = log_analyzer.get_report_data(test_log_path)
+        approximate = log_analyzer.get_report_data(test_log_path, {"AGGREGATION": "approximate"})
+        self.assertEqual(exact[0], approximate[0])
+        exact_rows = {row['url']: row for row in log_analyzer.create_report(*exact)}
+        for row in log_analyzer.create_report(*approximate):
+            self.assertEqual(row['count'], exact_rows[row['url']]['count'])
+            self.assertEqual(row['time_max'], exact_rows[row['url']]['time_max'])
+            self.assertAlmostEqual(row['time_med'], exact_rows[row['url']]['time_med'], delta=0.01 * row['time_max'])
+
+    def test_time_stats(self):
+        """
+        Тестирование time_stats для list и array('d') разного размера
+        """
+
+        for size in (1, 2, 100, 101):
+            values = [(number * 37 % 101) / 100 for number in range(size)]
+            expected = (size, sum(values), max(values), median(values))
+            for timings in (values, array('d', values)):
+                count, time_sum, time_max, time_med = log_analyzer.time_stats(timings)
+                self.assertEqual((count, time_max, time_med), (expected[0], expected[2], expected[3]))
+                self.assertAlmostEqual(time_sum, expected[1])
+                self.assertIsInstance(time_med, float)
+
+    def test_time_stats_percentiles(self):
+        """
+        Тестирование перцентилей time_stats в режимах exact и approximate
+        """
+
+        percentiles = (0, 50, 90, 95, 99, 100)
+        for size in (1, 2, 63, 100, 101):
+            values = [(number * 37 % 101) / 100 for number in range(size)]
+            ordered = sorted(values)
+            expected = []
+            for percentile in percentiles:
+                position = percentile / 100 * (size - 1)
+                lower = int(position)
+                upper = min(lower + 1, size - 1)
+                expected.append(ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower))
+            for timings in (values, array('d', values)):
+                stats = log_analyzer.time_stats(timings, percentiles)
+                self.assertEqual(stats[3], median(values))
+                for actual, value in zip(stats[4:], expected):
+                    self.assertAlmostEqual(actual, value)
+            sketch = log_analyzer.QuantileSketch.from_values(values, 0.01)
+            for actual, value in zip(log_analyzer.time_stats(sketch, percentiles)[4:], expected):
+                self.assertLessEqual(abs(actual - value), 0.01 * value + 0.01)
+
+        report = list(log_analyzer.create_report(3, 1.0, {"/a": [0.2, 0.3, 0.5]}, percentiles=(90, 99.9)))
+        self.assertAlmostEqual(report[0]["time_p90"], 0.46)
+        self.assertIn("time_p99.9", report[0])
+        with self.assertRaises(ValueError):
+            list(log_analyzer.create_report(3, 1.0, {"/a": [0.2, 0.3, 0.5]}, percentiles=(101,)))
+
+    def test_time_bucket(self):
+        """
+        Тестирование разбивки по интервалам времени (TIME_BUCKET)
+        """
+
+        bucket = log_analyzer.make_time_bucketer(15)
+        self.assertEqual(bucket("29/Jun/2017:03:50:22 +0300"), "2017-06-29T03:45")
+        self.assertEqual(bucket("29/Jun/2017:23:59:59 +0300"), "2017-06-29T23:45")
+        self.assertEqual(bucket("-"), "unknown")
+        with self.assertRaises(ValueError):
+            log_analyzer.make_time_bucketer(7)
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        line = '1.1.1.1 -  - [29/Jun/2017:{0} +0300] "GET {1} HTTP/1.1" 200 1 "-" "-" "-" "-" "-" {2}\n'
+        lines = [line.format("03:50:22", "/a", "0.5"), line.format("03:59:59", "/a", "1.5"),
+                 line.format("04:00:00", "/a", "1.0"), line.format("04:10:00", "/b", "2.0"), "broken\n"]
+        path = os.path.join(tmp_dir, "nginx-access-ui.log-20170629")
+        with open(path, "w", encoding="utf-8") as file:
+            file.writelines(lines * 2)
+        with gzip.open(path + ".gz", "wt", encoding="utf-8") as file:
+            file.writelines(lines * 2)
+
+        cfg = {"TIME_BUCKET": 60, "PERCENTILES": [90]}
+        for file_path, workers in ((path, 1), (path, 2), (path + ".gz", 1), (path + ".gz", 2)):
+            total_count, _, report_data, timeline = log_analyzer.get_report_data(file_path, {**cfg, "WORKERS": workers})
+            self.assertEqual(total_count, 8)
+            self.assertEqual(len(report_data["/a"]), 6)
+            self.assertEqual({key: cell.count for key, cell in timeline.items()}, {
+                ("2017-06-29T03:00", "/a"): 4, ("2017-06-29T04:00", "/a"): 2, ("2017-06-29T04:00", "/b"): 2,
+            })
+            self.assertEqual(timeline["2017-06-29T03:00", "/a"].total, 4.0)
+
+        report_cfg = {**config, **cfg, "REPORT_DIR": tmp_dir, "REPORT_SIZE": 1, "SAVE_AGGREGATES": False}
+        log_analyzer.build_report(report_cfg, "20170629", path)
+        with open(os.path.join(tmp_dir, "report-20170629-timeline.jsonl"), encoding="utf-8") as file:
+            rows = [json.loads(row) for row in file]
+        self.assertEqual([(row["bucket"], row["url"], row["count"]) for row in rows],
+                         [("2017-06-29T03:00", "/a", 4), ("2017-06-29T04:00", "/a", 2)])
+        self.assertIn("time_p90", rows[0])
+
+    def test_make_url_normalizer(self):
+        """
+        Тестирование make_url_normalizer
+        """
+
+        self.assertIsNone(log_analyzer.make_url_normalizer(config))
+        normalize = log_analyzer.make_url_normalizer(
+            {"STRIP_QUERY": True, "COLLAPSE_IDS": True, "URL_RULES": [["^/export/.*", "/export/*"]]}
+        )
+        self.assertEqual(normalize('/api/v2/banner/7763463'), '/api/v2/banner/{id}')
+        self.assertEqual(normalize('/api/1/photogenic_banners/list/?server_name=WIN7RB1'),
+                         '/api/{id}/photogenic_banners/list/')
+        self.assertEqual(normalize('/api/v2/group/1dc7161be3/banners'), '/api/v2/group/{hex}/banners')
+        self.assertEqual(normalize('/api/v2/facade/'), '/api/v2/facade/')
+        self.assertEqual(normalize('/export/2017/06/report.csv'), '/export/*')
+
+    def test_aggregate_max_urls(self):
+        """
+        Тестирование ограничения числа url в aggregate и merge_report_data
+        """
+
+        parsed_lines = [(f'/api/v2/banner/{number}', '0.1') for number in range(10)]
+        total_count, _, report_data = log_analyzer.aggregate(parsed_lines, max_urls=3)
+        self.assertEqual(total_count, 10)
+        self.assertEqual(len(report_data), 4)
+        self.assertEqual(len(report_data[log_analyzer.OTHER_URL]), 7)
+
+        parts = [log_analyzer.aggregate(parsed_lines[:5]), log_analyzer.aggregate(parsed_lines[5:])]
+        _, _, merged = log_analyzer.merge_report_data(parts, max_urls=6)
+        self.assertEqual(len(merged), 7)
+        self.assertEqual(len(merged[log_analyzer.OTHER_URL]), 4)
+
+    def test_get_report_data_incremental(self):
+        """
+        Тестирование get_report_data_incremental на дописываемом логе
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        log_path = os.path.join(tmp_dir, "nginx-access-ui.log-20170101")
+        cfg = {**log_analyzer.default_config, "CHECKPOINT": os.path.join(tmp_dir, "checkpoint")}
+        with open(test_log_path, "rb") as file:
+            content = (file.read().rstrip(b"\n") + b"\n") * 10
+        # первый запуск видит недописанную последнюю строку
+        split_at = len(content) // 2
+        with open(log_path, "wb") as file:
+            file.write(content[:split_at])
+        first_count = log_analyzer.get_report_data_incremental(log_path, cfg)[0]
+        self.assertEqual(first_count, content[:split_at].count(b"\n"))
+        self.assertEqual(os.stat(cfg["CHECKPOINT"]).st_mode & 0o777, 0o644)
+        self.assertEqual(sorted(os.listdir(tmp_dir)), ["checkpoint", os.path.basename(log_path)])
+
+        with open(log_path, "ab") as file:
+            file.write(content[split_at:])
+        total_count, total_time, report_data = log_analyzer.get_report_data_incremental(log_path, cfg)
+        expected_count, expected_time, expected_data = log_analyzer.get_report_data(log_path)
+        self.assertEqual(total_count, expected_count)
+        self.assertAlmostEqual(total_time, expected_time)
+        self.assertEqual({url: sorted(times) for url, times in report_data.items()},
+                         {url: sorted(times) for url, times in expected_data.items()})
+
+        # без новых строк агрегат берется из checkpoint
+        self.assertEqual(log_analyzer.get_report_data_incremental(log_path, cfg)[0], expected_count)
+        # при смене настроек агрегации лог разбирается заново
+        approximate = log_analyzer.get_report_data_incremental(log_path, {**cfg, "AGGREGATION": "approximate"})
+        self.assertEqual(approximate[0], expected_count)
+
+    def test_save_load_aggregates(self):
+        """
+        Тестирование save_aggregates и load_aggregates в режимах exact и approximate
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, "report-20170101.agg")
+        for mode in ("exact", "approximate"):
+            expected = log_analyzer.get_report_data(test_log_path, {"AGGREGATION": mode})
+            log_analyzer.save_aggregates(path, *expected)
+            loaded = log_analyzer.load_aggregates(path)
+            self.assertEqual(loaded[:2], expected[:2])
+            self.assertTrue(all(isinstance(timings, log_analyzer.QuantileSketch) for timings in loaded[2].values()))
+            for row, expected_row in zip(log_analyzer.create_report(*loaded), log_analyzer.create_report(*expected)):
+                self.assertEqual({**row, "time_med": 0}, {**expected_row, "time_med": 0})
+                self.assertAlmostEqual(row["time_med"], expected_row["time_med"], delta=expected_row["time_med"] * 0.02)
+
+        # размер файла не растет с числом запросов одного url
+        times = array("d", [0.1, 0.25, 0.5] * 100000)
+        log_analyzer.save_aggregates(path, len(times), sum(times), {"/api": times})
+        self.assertLess(os.path.getsize(path), 4096)
+        self.assertEqual(log_analyzer.load_aggregates(path)[2]["/api"].count, len(times))
+
+        # файлы прежнего формата exact со всеми временами читаются как есть
+        columnar.write_columns(path, [("url", columnar.STR, [["/a", "/b"]]), ("count", "q", [[2, 1]]),
+                                      ("times", "d", [[0.1, 0.2, 0.3]])],
+                               {"total_count": 3, "total_time": 0.6, "mode": "exact"})
+        self.assertEqual(log_analyzer.load_aggregates(path),
+                         (3, 0.6, {"/a": array("d", [0.1, 0.2]), "/b": array("d", [0.3])}))
+
+    def test_rollup(self):
+        """
+        Тестирование rollup по сохраненным дневным агрегатам
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        cfg = {**config, "REPORT_DIR": tmp_dir}
+        for day, mode in (("20170626", "exact"), ("20170627", "approximate"), ("20170703", "exact")):
+            report_data = log_analyzer.get_report_data(test_log_path, {"AGGREGATION": mode})
+            log_analyzer.save_aggregates(log_analyzer.aggregates_path(cfg, day), *report_data)
+
+        total_count, _, report_data = log_analyzer.rollup(cfg, "2017-W26")
+        self.assertEqual(total_count, 4)
+        self.assertTrue(all(isinstance(timings, log_analyzer.QuantileSketch) for timings in report_data.values()))
+        self.assertTrue(os.path.exists(os.path.join(tmp_dir, "report-2017-W26.html")))
+        self.assertEqual(log_analyzer.rollup(cfg, "201707")[0], 2)
+        self.assertEqual(log_analyzer.rollup(cfg, "20170601..20170731")[0], 6)
+        self.assertIsNone(log_analyzer.rollup(cfg, "201705"))
+
+    def test_backfill(self):
+        """
+        Тестирование backfill за диапазон дат
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        cfg = {**config, "LOG_DIR": os.path.join(tmp_dir, "log"), "REPORT_DIR": os.path.join(tmp_dir, "reports"),
+               "WORKERS": 2, "SAVE_AGGREGATES": True}
+        os.mkdir(cfg["LOG_DIR"])
+        os.mkdir(cfg["REPORT_DIR"])
+        with open(test_log_path, "rb") as file:
+            content = file.read()
+        for day in ("20170627", "20170628", "20170629", "20170701"):
+            shutil.copy(test_log_path, os.path.join(cfg["LOG_DIR"], f"nginx-access-ui.log-{day}"))
+        with gzip.open(os.path.join(cfg["LOG_DIR"], "nginx-access-ui.log-20170630.gz"), "wb") as file:
+            file.write(content)
+        open(os.path.join(cfg["REPORT_DIR"], "report-20170628.html"), "w", encoding="utf-8").close()
+
+        summary = log_analyzer.backfill(cfg, "20170627..20170630")
+        self.assertEqual([result["date"] for result in summary], ["20170627", "20170629", "20170630"])
+        self.assertTrue(all(result["lines"] == 2 for result in summary))
+        for day in ("20170627", "20170629", "20170630"):
+            self.assertTrue(os.path.exists(os.path.join(cfg["REPORT_DIR"], f"report-{day}.html")))
+            self.assertTrue(os.path.exists(log_analyzer.aggregates_path(cfg, day)))
+        self.assertFalse(os.path.exists(os.path.join(cfg["REPORT_DIR"], "report-20170701.html")))
+        self.assertEqual(log_analyzer.backfill(cfg, "20170627..20170630"), [])
+
+        # битый gzip не останавливает backfill остальных дат
+        with open(os.path.join(cfg["LOG_DIR"], "nginx-access-ui.log-20170626.gz"), "wb") as file:
+            file.write(b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\x03" + b"\xff" * 20)
+        shutil.copy(test_log_path, os.path.join(cfg["LOG_DIR"], "nginx-access-ui.log-20170625"))
+        with self.assertLogs(level="ERROR"):
+            summary = log_analyzer.backfill(cfg, "20170625..20170626")
+        self.assertEqual([result["date"] for result in summary], ["20170625"])
+        self.assertIn(date(2017, 6, 25), log_analyzer.report_index(cfg))
+
+    def test_main_inputs(self):
+        """
+        Тестирование общего отчета по логам нескольких хостов
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        for host in ("web1", "web2"):
+            os.makedirs(os.path.join(tmp_dir, "log", host))
+            shutil.copy(test_log_path, os.path.join(tmp_dir, "log", host, "nginx-access-ui.log-20170630"))
+        pattern = os.path.join(tmp_dir, "log", "*", "nginx-access-ui.log-20170630")
+        paths = log_analyzer.expand_inputs([pattern, pattern])
+        self.assertEqual(len(paths), 2)
+
+        hosts = {}
+        total_count, _, report_data = log_analyzer.get_report_data_multi(
+            paths, {"WORKERS": 2}, lambda host, *result: hosts.update({host: result[0]}))
+        self.assertEqual(hosts, {"web1": 2, "web2": 2})
+        self.assertEqual(total_count, 4)
+        self.assertEqual(sum(map(len, report_data.values())), 4)
+        self.assertEqual(log_analyzer.host_name(paths[0], r"/(?P<host>web\d)/"), "web1")
+
+        cfg = {**config, "REPORT_DIR": tmp_dir, "INPUT": [pattern], "PER_HOST": True, "WORKERS": 2}
+        log_analyzer.main_inputs(cfg)
+        for name in ("20170630", "20170630-web1", "20170630-web2"):
+            self.assertTrue(os.path.exists(os.path.join(tmp_dir, f"report-{name}.html")))
+        self.assertIn(date(2017, 6, 30), log_analyzer.report_index(cfg))
+
+    def test_parse_period(self):
+        """
+        Тестирование parse_period
+        """
+
+        self.assertEqual(log_analyzer.parse_period("201702"), (date(2017, 2, 1), date(2017, 2, 28)))
+        self.assertEqual(log_analyzer.parse_period("2017-W26"), (date(2017, 6, 26), date(2017, 7, 2)))
+        self.assertEqual(log_analyzer.parse_period("20170601..20170603"), (date(2017, 6, 1), date(2017, 6, 3)))
+        with self.assertRaises(ValueError):
+            log_analyzer.parse_period("20170603..20170601")
+
+    def test_read_lines_gzip(self):
+        """
+        Тестирование read_lines для gzip-лога из нескольких gzip-членов через zlib и внешнюю команду
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        gzip_path = os.path.join(tmp_dir, "nginx-access-ui.log-20170101.gz")
+        with open(test_log_path, "rb") as file:
+            content = file.read().rstrip(b"\n") + b"\n"
+        with open(gzip_path, "wb") as file:
+            file.write(gzip.compress(content * 3) + gzip.compress(content.rstrip(b"\n")))
+
+        expected = list(log_analyzer.read_lines(test_log_path)) * 4
+        self.assertEqual(list(log_analyzer.read_lines(gzip_path)), expected)
+        if shutil.which("zcat"):
+            self.assertEqual(list(log_analyzer.read_lines(gzip_path, ["zcat"])), expected)
+        batches = list(log_analyzer.read_batches(gzip_path, batch_size=100))
+        self.assertEqual(b"".join(batches), content * 3 + content.rstrip(b"\n"))
+        self.assertTrue(all(batch.endswith(b"\n") for batch in batches[:-1]))
+
+    def test_read_gzip_truncated(self):
+        """
+        Тестирование обрезанного gzip-лога: разбор прерывается EOFError, как в gzip.open
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        gzip_path = os.path.join(tmp_dir, "nginx-access-ui.log-20170101.gz")
+        with open(test_log_path, "rb") as file:
+            content = file.read() * 2000
+        compressed = gzip.compress(content)
+        for cut in (len(compressed) // 2, len(compressed) - 4):
+            with open(gzip_path, "wb") as file:
+                file.write(compressed[:cut])
+            with self.assertRaises(EOFError):
+                list(log_analyzer.read_lines(gzip_path))
+            with self.assertRaises(EOFError):
+                log_analyzer.get_report_data(gzip_path, {"WORKERS": 2})
+        open(gzip_path, "wb").close()
+        self.assertEqual(list(log_analyzer.read_lines(gzip_path)), [])
+
+    def test_process_line_bytes(self):
+        """
+        Тестирование process_line_bytes
+        """
+
+        with open(test_log_path, "r", encoding="utf-8") as file:
+            for line in file:
+                self.assertEqual(log_analyzer.process_line_bytes(line.encode()), log_analyzer.process_line(line))
+        self.assertIsNone(log_analyzer.process_line_bytes(b'garbage'))
+
+    def test_count_parsed_error_threshold(self):
+        """
+        Тестирование прерывания разбора по ERROR_THRESHOLD
+        """
+
+        parsed_line = ('/api/v2/banner/1', '0.1')
+        # ошибки разбросаны равномерно и не превышают порог
+        results = [None if number % 4 == 0 else parsed_line for number in range(1000)]
+        self.assertEqual(len(list(log_analyzer.count_parsed(results, 0.3, 100))), 750)
+        # сплошной блок ошибок прерывает разбор, не дочитывая остальное
+        results = [parsed_line] * 100 + [None] * 60 + [parsed_line] * 10 ** 6
+        consumed = []
+        with self.assertRaises(log_analyzer.ErrorThresholdExceeded):
+            for line in log_analyzer.count_parsed(iter(results), 0.5, 100):
+                consumed.append(line)
+        self.assertEqual(len(consumed), 100)
+        # короткий лог проверяется по общей доле в конце
+        with self.assertRaises(log_analyzer.ErrorThresholdExceeded):
+            list(log_analyzer.count_parsed([None, None, parsed_line], 0.5, 100))
+        self.assertEqual(len(list(log_analyzer.count_parsed([None, None, parsed_line]))), 1)
+
+    def test_get_report_data_error_threshold(self):
+        """
+        Тестирование get_report_data на логе другого формата
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, "nginx-access-ui.log-20170101")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write('1.1.1.1 - - [29/Jun/2017:03:50:22 +0300] "GET / HTTP/1.1" 200 927\n' * 100)
+        cfg = {"ERROR_THRESHOLD": 0.2, "ERROR_WINDOW": 10}
+        with self.assertRaises(log_analyzer.ErrorThresholdExceeded):
+            log_analyzer.get_report_data(path, cfg)
+        with self.assertRaises(log_analyzer.ErrorThresholdExceeded):
+            log_analyzer.get_report_data(path, {**cfg, "WORKERS": 2})
+
+    def test_parallel_error_threshold(self):
+        """
+        Тестирование ERROR_THRESHOLD при разборе в воркерах: доля среди всех строк проверяется по всему логу,
+        а не по части, доставшейся воркеру
+        """
+
+        with open(test_log_path, "rb") as file:
+            line = file.readline()
+        cfg = {"ERROR_THRESHOLD": 0.06}
+        result, counts = log_analyzer.aggregate_batch(b"garbage\n", cfg)
+        self.assertEqual(result[0], 0)
+        self.assertEqual(counts, {"failed": 1, "total": 1})
+        good = log_analyzer.aggregate_batch(line * 20, cfg)
+        self.assertEqual(log_analyzer.merge_partials([good, (result, counts)], cfg)[0], 20)
+        with self.assertRaises(log_analyzer.ErrorThresholdExceeded):
+            log_analyzer.merge_partials([(result, counts)], cfg)
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, "nginx-access-ui.log-20170101")
+        with open(path, "wb") as file:
+            file.write(line * 20 + b"garbage\n")
+        self.assertEqual(log_analyzer.get_report_data(path, {**cfg, "WORKERS": 2})[0], 20)
+
+    def test_get_report_data_progress(self):
+        """
+        Тестирование прогресса разбора в get_report_data
+        """
+
+        cfg = {"PROGRESS": True}
+        with self.assertLogs(level="INFO") as logs:
+            total_count, _, report_data = log_analyzer.get_report_data(test_log_path, cfg)
+        events = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertEqual(events[-1]["event"], "progress")
+        self.assertEqual(events[-1]["lines"], total_count)
+        self.assertEqual(events[-1]["urls"], len(report_data))
+        self.assertEqual(events[-1]["bytes"], os.path.getsize(test_log_path))
+        self.assertIsNone(log_analyzer.make_progress({}, test_log_path))
+
     def test_create_report(self):
         """
         Тестирование create_report
@@ -126,6 +720,41 @@ class TestLogAnalyzer(unittest.TestCase):
                      }
                 )
 
+    def test_render_report(self):
+        """
+        Тестирование render_report
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        report = [
+            {"url": "/api/</script>", "count": 1, "time_sum": 0.1},
+            {"url": "/api/банер", "count": 2, "time_sum": 0.5},
+        ]
+        log_analyzer.render_report({"REPORT_SIZE": 1000, "REPORT_DIR": tmp_dir}, "20170101", report)
+        self.assertEqual(os.listdir(tmp_dir), ["report-20170101.html"])
+        with open(os.path.join(tmp_dir, "report-20170101.html"), "r", encoding="utf-8") as file:
+            page = file.read()
+        head, tail = log_analyzer.load_template()
+        self.assertTrue(page.startswith(head) and page.endswith(tail))
+        table = page[len(head):len(page) - len(tail)]
+        self.assertNotIn("</script>", table)
+        self.assertEqual(json.loads(table), sorted(report, key=lambda row: -row["time_sum"]))
+
+    def test_create_report_top(self):
+        """
+        Тестирование create_report с ограничением размера отчета
+        """
+
+        request_dict = {
+            '/api/v2/banner/25019354': [0.39, 0.35],
+            '/api/v2/banner/16852664': [0.199],
+            '/api/1/photogenic_banners/list/?server_name=WIN7RB4': [0.133],
+        }
+        report = list(log_analyzer.create_report(4, 1.072, request_dict, size=2))
+        self.assertEqual([row['url'] for row in report], ['/api/v2/banner/25019354', '/api/v2/banner/16852664'])
+        self.assertEqual(report[0]['time_med'], 0.37)
+
 
 if __name__ == '__main__':
     unittest.main()
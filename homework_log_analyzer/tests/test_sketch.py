@@ -0,0 +1,64 @@
+"""
+Модуль тестирования sketch
+"""
+
+import pickle
+import random
+import unittest
+from statistics import median
+
+from sketch import QuantileSketch
+
+
+class TestQuantileSketch(unittest.TestCase):
+    """
+    Класс TestQuantileSketch
+    """
+
+    def test_aggregates(self):
+        """
+        Тестирование count/total/max
+        """
+
+        sketch = QuantileSketch()
+        for value in (0.39, 0.0, 0.35):
+            sketch.append(value)
+        self.assertEqual(len(sketch), 3)
+        self.assertAlmostEqual(sketch.total, 0.74)
+        self.assertEqual(sketch.max, 0.39)
+        self.assertEqual(sketch.quantile(0), 0.0)
+        self.assertEqual(sketch.quantile(1), 0.39)
+
+    def test_median_error_bound(self):
+        """
+        Тестирование погрешности медианы
+        """
+
+        rnd = random.Random(1)
+        for size in (1, 2, 7, 100, 1001):
+            values = [rnd.lognormvariate(-2, 1) for _ in range(size)]
+            sketch = QuantileSketch(0.01)
+            for value in values:
+                sketch.append(value)
+            exact = median(values)
+            self.assertLessEqual(abs(sketch.median() - exact), 0.01 * exact + 1e-12)
+
+    def test_merge(self):
+        """
+        Тестирование объединения и сериализации
+        """
+
+        first, second, whole = QuantileSketch(), QuantileSketch(), QuantileSketch()
+        for number in range(1, 101):
+            (first if number % 2 else second).append(number / 100)
+            whole.append(number / 100)
+        first += pickle.loads(pickle.dumps(second))
+        self.assertEqual(first.count, whole.count)
+        self.assertEqual(first.bins, whole.bins)
+        self.assertEqual(first.median(), whole.median())
+        with self.assertRaises(ValueError):
+            first += QuantileSketch(0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
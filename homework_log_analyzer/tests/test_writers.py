@@ -0,0 +1,79 @@
+"""
+Модуль тестирования writers
+"""
+
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import columnar
+import writers
+from atomicfile import atomic_open
+
+ROWS = [
+    {"url": "/api/v2/banner/1", "count": 2, "count_perc": 50.0, "time_sum": 1.5},
+    {"url": "/api/v2/группа", "count": 2, "count_perc": 50.0, "time_sum": 0.25},
+]
+
+
+class TestWriters(unittest.TestCase):
+    """
+    Класс TestWriters
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def test_write_report(self):
+        """
+        Тестирование записи отчета во всех форматах
+        """
+
+        paths = {report_format: writers.report_path(self.tmp_dir, "20170101", report_format)
+                 for report_format in writers.WRITERS}
+        for report_format, path in paths.items():
+            writers.write_report(report_format, path, iter(ROWS))
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)),
+                         ["report-20170101.col", "report-20170101.csv", "report-20170101.jsonl"])
+
+        with open(paths["jsonl"], "r", encoding="utf-8") as file:
+            self.assertEqual([json.loads(line) for line in file], ROWS)
+        with open(paths["csv"], "r", encoding="utf-8", newline="") as file:
+            rows = list(csv.DictReader(file))
+        self.assertEqual([row["url"] for row in rows], [row["url"] for row in ROWS])
+        self.assertEqual([float(row["time_sum"]) for row in rows], [row["time_sum"] for row in ROWS])
+        meta, columns = columnar.read_columns(paths["columnar"])
+        self.assertEqual(meta["rows"], 2)
+        self.assertEqual(columns["url"], [row["url"] for row in ROWS])
+        self.assertEqual(columns["count"].typecode, "q")
+        self.assertEqual(list(columns["time_sum"]), [row["time_sum"] for row in ROWS])
+
+    def test_unknown_format(self):
+        """
+        Тестирование неизвестного формата
+        """
+
+        with self.assertRaises(ValueError):
+            writers.report_path(self.tmp_dir, "20170101", "parquet")
+        with self.assertRaises(ValueError):
+            writers.write_report("html", os.path.join(self.tmp_dir, "report.html"), ROWS)
+
+    def test_atomic_open(self):
+        """
+        Тестирование atomic_open: при ошибке файл не создается и временный файл удаляется
+        """
+
+        path = os.path.join(self.tmp_dir, "report-20170101.csv")
+        with self.assertRaises(RuntimeError):
+            with atomic_open(path) as file:
+                file.write("partial")
+                raise RuntimeError
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
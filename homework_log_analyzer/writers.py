@@ -0,0 +1,87 @@
+"""
+Машиночитаемые форматы отчета log_analyzer: строки create_report записываются
+в JSON lines, CSV или колоночный файл columnar.py
+"""
+import csv
+import json
+import os
+
+import columnar
+from atomicfile import atomic_open
+
+# расширение файла отчета для каждого формата; html рендерится по шаблону в log_analyzer.render_report
+SUFFIXES = {
+    "html": ".html",
+    "jsonl": ".jsonl",
+    "csv": ".csv",
+    "columnar": ".col",
+}
+
+
+def write_jsonl(path, rows):
+    """
+    Пишет строки отчета по одному JSON-объекту на строку
+    """
+
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    with atomic_open(path, encoding="utf-8") as file:
+        for row in rows:
+            file.write(encode(row))
+            file.write("\n")
+
+
+def write_csv(path, rows):
+    """
+    Пишет строки отчета в CSV с заголовком, колонки берутся из первой строки
+    """
+
+    rows = iter(rows)
+    first = next(rows, None)
+    with atomic_open(path, encoding="utf-8", newline="") as file:
+        if first is None:
+            return
+        writer = csv.DictWriter(file, fieldnames=list(first))
+        writer.writeheader()
+        writer.writerow(first)
+        writer.writerows(rows)
+
+
+def write_columnar(path, rows):
+    """
+    Пишет строки отчета в колоночный файл: строковые колонки как str, целые как int64, остальные как double
+    """
+
+    rows = list(rows)
+    columns = []
+    for name in rows[0] if rows else ():
+        sample = rows[0][name]
+        typecode = columnar.STR if isinstance(sample, str) else "q" if isinstance(sample, int) else "d"
+        columns.append((name, typecode, [[row[name] for row in rows]]))
+    columnar.write_columns(path, columns, {"rows": len(rows)})
+
+
+WRITERS = {
+    "jsonl": write_jsonl,
+    "csv": write_csv,
+    "columnar": write_columnar,
+}
+
+
+def report_path(report_dir, name, report_format):
+    """
+    Возвращает путь к файлу отчета report-<name> в формате report_format
+    """
+
+    if report_format not in SUFFIXES:
+        raise ValueError(f"unknown report format: {report_format}")
+    return os.path.join(report_dir, f"report-{name}{SUFFIXES[report_format]}")
+
+
+def write_report(report_format, path, rows):
+    """
+    Пишет строки отчета в файл формата report_format
+    """
+
+    if report_format not in WRITERS:
+        raise ValueError(f"unknown report format: {report_format}")
+    WRITERS[report_format](path, rows)
@@ -2,14 +2,18 @@
 import hashlib
 import json
 import logging
+import os
+import signal
+import socket
+import sys
 import uuid
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import HTTPServer, ThreadingHTTPServer, BaseHTTPRequestHandler
 from optparse import OptionParser
 from requests import RequestException
 from store import Store, RedisDBStorage
-from scoring import get_interests, get_score
+from scoring import get_interests_many, get_score
 
 SALT = "Otus"
 ADMIN_LOGIN = "admin"
@@ -182,10 +186,8 @@ class ClientsInterestsRequest(BaseRequest):
     def get_result(self, _, context, store):
         client_ids_list = getattr(self, 'client_ids', [])
         context["nclients"] = len(client_ids_list)
-        result = {}
-        for client_id in client_ids_list:
-            result[f"client_id{client_id}"] = get_interests(store, client_id)
-        return result
+        interests = get_interests_many(store, client_ids_list)
+        return {f"client_id{client_id}": value for client_id, value in zip(client_ids_list, interests)}
 
 
 class OnlineScoreRequest(BaseRequest):
@@ -255,64 +257,137 @@ def method_handler(request, ctx, store):
     return result, OK
 
 
-class MainHTTPHandler(BaseHTTPRequestHandler):
-    router = {
-        "method": method_handler
-    }
+ROUTER = {
+    "method": method_handler
+}
+
+
+def get_request_id(headers):
+    return headers.get('HTTP_X_REQUEST_ID', uuid.uuid4().hex)
+
+
+def handle_request(path, data_string, headers, store, router=None):
+    router = ROUTER if router is None else router
+    response, code = {}, OK
+    context = {"request_id": get_request_id(headers)}
+    request = None
+    try:
+        request = json.loads(data_string)
+    except (ValueError, RequestException) as err:
+        logging.exception("Bad request error: %s", err)
+        code = BAD_REQUEST
+
+    if request:
+        path = path.strip("/")
+        logging.info("%s: %s %s", path, data_string, context["request_id"])
+        if path in router:
+            try:
+                response, code = router[path]({"body": request, "headers": headers}, context, store)
+            except Exception as err:
+                logging.exception("Unexpected error: %s", err)
+                code = INTERNAL_ERROR
+        else:
+            code = NOT_FOUND
+
+    if code not in ERRORS:
+        res = {"response": response, "code": code}
+    else:
+        res = {"error": response or ERRORS.get(code, "Unknown Error"), "code": code}
+    context.update(res)
+    logging.info(context)
+    return code, res
+
+
+def make_store():
     store = Store(RedisDBStorage())
     store.storage.connect()
+    return store
 
-    @staticmethod
-    def get_request_id(headers):
-        return headers.get('HTTP_X_REQUEST_ID', uuid.uuid4().hex)
 
-    def do_POST(self):
-        response, code = {}, OK
-        context = {"request_id": self.get_request_id(self.headers)}
-        request = None
-        data_string = None
-        try:
-            data_string = self.rfile.read(int(self.headers['Content-Length']))
-            request = json.loads(data_string)
-        except RequestException as err:
-            logging.exception("Bad request error: %s", err)
-            code = BAD_REQUEST
-
-        if request:
-            path = self.path.strip("/")
-            logging.info("%s: %s %s", self.path, data_string, context["request_id"])
-            if path in self.router:
-                try:
-                    response, code = self.router[path]({"body": request, "headers": self.headers}, context, self.store)
-                except Exception as err:
-                    logging.exception("Unexpected error: %s", err)
-                    code = INTERNAL_ERROR
-            else:
-                code = NOT_FOUND
+class MainHTTPHandler(BaseHTTPRequestHandler):
+    router = ROUTER
+    store = make_store()
+
+    get_request_id = staticmethod(get_request_id)
 
+    def do_POST(self):
+        data_string = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        code, res = handle_request(self.path, data_string, self.headers, self.store, self.router)
         self.send_response(code)
         self.send_header("Content-Type", "application/json")
         self.end_headers()
-        if code not in ERRORS:
-            res = {"response": response, "code": code}
-        else:
-            res = {"error": response or ERRORS.get(code, "Unknown Error"), "code": code}
-        context.update(res)
-        logging.info(context)
         self.wfile.write(json.dumps(res).encode('utf-8'))
 
 
+def make_server(port, threads=False, reuse_port=False):
+    server_class = ThreadingHTTPServer if threads else HTTPServer
+    server = server_class(("localhost", port), MainHTTPHandler, bind_and_activate=False)
+    try:
+        if reuse_port:
+            server.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server.server_bind()
+        server.server_activate()
+    except OSError:
+        server.server_close()
+        raise
+    return server
+
+
+def serve(server):
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+def run_worker(port, threads):
+    MainHTTPHandler.store = make_store()
+    code = 0
+    try:
+        serve(make_server(port, threads, reuse_port=True))
+    except Exception as err:
+        logging.exception("Worker %s failed: %s", os.getpid(), err)
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def run_workers(port, workers, threads=False):
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise OSError("SO_REUSEPORT is not supported on this platform")
+    pids = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        for _ in range(workers):
+            pid = os.fork()
+            if pid == 0:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                run_worker(port, threads)
+            pids.append(pid)
+        logging.info("Started %s workers: %s", workers, pids)
+        for pid in pids:
+            os.waitpid(pid, 0)
+    except (KeyboardInterrupt, SystemExit):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+
+
 if __name__ == "__main__":
     op = OptionParser()
     op.add_option("-p", "--port", action="store", type=int, default=8080)
     op.add_option("-l", "--log", action="store", default=None)
+    op.add_option("-w", "--workers", action="store", type=int, default=1)
+    op.add_option("-t", "--threads", action="store_true", default=False)
     (opts, args) = op.parse_args()
     logging.basicConfig(filename=opts.log, level=logging.INFO,
                         format='[%(asctime)s] %(levelname).1s %(message)s', datefmt='%Y.%m.%d %H:%M:%S')
-    server = HTTPServer(("localhost", opts.port), MainHTTPHandler)
     logging.info("Starting server at %s", opts.port)
-    try:
-        server.serve_forever()
-    except KeyboardInterrupt:
-        pass
-    server.server_close()
+    if opts.workers > 1:
+        run_workers(opts.port, opts.workers, opts.threads)
+    else:
+        serve(make_server(opts.port, opts.threads))
@@ -0,0 +1,130 @@
+# pylint: disable=C0114,C0115,C0116,C0301,C0103,W0402,W0703
+import asyncio
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.client import HTTPException, parse_headers
+from optparse import OptionParser
+
+from api import handle_request, make_store, ROUTER
+
+HEADERS_END = b"\r\n\r\n"
+MAX_HEADERS_SIZE = 64 * 1024
+MAX_BODY_SIZE = 1024 * 1024
+KEEPALIVE_TIMEOUT = 15
+BACKLOG = 4096
+THREADS = 32
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+def keep_alive(version, headers):
+    connection = headers.get("Connection", "").lower()
+    if version == "HTTP/1.1":
+        return connection != "close"
+    return connection == "keep-alive"
+
+
+def make_response(code, res, alive):
+    body = json.dumps(res).encode("utf-8")
+    head = (f"HTTP/1.1 {code} {HTTPStatus(code).phrase}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+
+class AsyncScoringServer:
+    def __init__(self, store, host="localhost", port=8080, router=None, threads=THREADS):
+        self.store = store
+        self.host = host
+        self.port = port
+        self.router = ROUTER if router is None else router
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port,
+                                                 limit=MAX_HEADERS_SIZE, backlog=BACKLOG)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.executor.shutdown(wait=False)
+
+    async def serve_forever(self):
+        await self.start()
+        logging.info("Starting asyncio server at %s", self.port)
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def read_request(self, reader):
+        head = await asyncio.wait_for(reader.readuntil(HEADERS_END), KEEPALIVE_TIMEOUT)
+        request_line, _, raw_headers = head.partition(b"\r\n")
+        method, path, version = request_line.decode("latin-1").split()
+        headers = parse_headers(io.BytesIO(raw_headers))
+        if "Transfer-Encoding" in headers:
+            raise ValueError("Transfer-Encoding is not supported")
+        length = int(headers.get("Content-Length", 0))
+        if length < 0:
+            raise ValueError(f"Invalid Content-Length: {length}")
+        if length > MAX_BODY_SIZE:
+            raise BodyTooLarge(f"Content-Length {length} exceeds {MAX_BODY_SIZE}")
+        body = await asyncio.wait_for(reader.readexactly(length), KEEPALIVE_TIMEOUT) if length else b""
+        return method, path, version, headers, body
+
+    async def handle_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    method, path, version, headers, body = await self.read_request(reader)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                except BodyTooLarge as err:
+                    logging.error("Bad HTTP request: %s", err)
+                    code = HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+                    writer.write(make_response(code, {"error": code.phrase, "code": code}, False))
+                    break
+                except (asyncio.LimitOverrunError, HTTPException, ValueError, UnicodeDecodeError) as err:
+                    logging.error("Bad HTTP request: %s", err)
+                    writer.write(make_response(HTTPStatus.BAD_REQUEST, {"error": "Bad Request", "code": 400}, False))
+                    break
+
+                alive = keep_alive(version, headers)
+                if method != "POST":
+                    code = HTTPStatus.NOT_IMPLEMENTED
+                    res = {"error": f"Unsupported method ({method})", "code": code}
+                else:
+                    code, res = await loop.run_in_executor(
+                        self.executor, handle_request, path, body, headers, self.store, self.router)
+                writer.write(make_response(code, res, alive))
+                await writer.drain()
+                if not alive:
+                    break
+        except ConnectionError:
+            pass
+        except Exception as err:
+            logging.exception("Unexpected connection error: %s", err)
+        finally:
+            writer.close()
+
+
+if __name__ == "__main__":
+    op = OptionParser()
+    op.add_option("-p", "--port", action="store", type=int, default=8080)
+    op.add_option("-l", "--log", action="store", default=None)
+    op.add_option("--threads", action="store", type=int, default=THREADS)
+    (opts, args) = op.parse_args()
+    logging.basicConfig(filename=opts.log, level=logging.INFO,
+                        format='[%(asctime)s] %(levelname).1s %(message)s', datefmt='%Y.%m.%d %H:%M:%S')
+    try:
+        asyncio.run(AsyncScoringServer(make_store(), port=opts.port, threads=opts.threads).serve_forever())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,74 @@
+# pylint: disable=C0114,C0115,C0116,C0301,C0103,W0402
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from optparse import OptionParser
+
+from store import RedisDBStorage
+
+
+def single(storage, keys):
+    for key in keys:
+        storage.set(key, "[]")
+    for key in keys:
+        storage.get(key)
+
+
+def batched(storage, keys, batch):
+    for start in range(0, len(keys), batch):
+        storage.set_many({key: "[]" for key in keys[start:start + batch]})
+    for start in range(0, len(keys), batch):
+        storage.get_many(keys[start:start + batch])
+
+
+def measure(storage, ops, threads, batch):
+    keys = [f"bench:{i}" for i in range(ops)]
+    parts = [keys[i::threads] for i in range(threads)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        if batch > 1:
+            list(executor.map(lambda part: batched(storage, part, batch), parts))
+        else:
+            list(executor.map(lambda part: single(storage, part), parts))
+    elapsed = time.perf_counter() - started
+    return {"mode": "pipeline" if batch > 1 else "single", "batch": batch, "threads": threads,
+            "max_connections": storage.pool_options["max_connections"], "ops": 2 * ops, "seconds": round(elapsed, 3),
+            "ops_per_sec": round(2 * ops / elapsed, 1)}
+
+
+def start_fake_server():
+    from fakeredis import TcpFakeServer  # pylint: disable=C0415
+    server = TcpFakeServer(("localhost", 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    op = OptionParser(usage="%prog [options]")
+    op.add_option("--host", action="store", default="localhost")
+    op.add_option("--port", action="store", type=int, default=None,
+                  help="redis-server port, by default a fakeredis TCP server is started")
+    op.add_option("-n", "--ops", action="store", type=int, default=10000)
+    op.add_option("-t", "--threads", action="store", type=int, default=8)
+    op.add_option("-b", "--batch", action="store", type=int, default=100)
+    op.add_option("--max-connections", action="store", type=int, default=8)
+    (opts, _) = op.parse_args()
+    fake = None
+    if opts.port is None:
+        fake = start_fake_server()
+        opts.host, opts.port = fake.server_address[:2]
+    storage = RedisDBStorage(opts.host, opts.port, pool_options={"max_connections": opts.max_connections})
+    storage.connect()
+    try:
+        for batch in (1, opts.batch):
+            print(json.dumps(measure(storage, opts.ops, opts.threads, batch)))
+        storage.server.delete(*(f"bench:{i}" for i in range(opts.ops)))
+    finally:
+        storage.pool.disconnect()
+        if fake is not None:
+            fake.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# pylint: disable=C0114,C0115,C0116,C0301,C0103,R0903,W0402
+import asyncio
+import hashlib
+import json
+import time
+from datetime import datetime
+from optparse import OptionParser
+
+from api import ADMIN_LOGIN, ADMIN_SALT
+
+
+def admin_request():
+    token = hashlib.sha512((datetime.now().strftime("%Y%m%d%H") + ADMIN_SALT).encode("utf-8")).hexdigest()
+    return {"account": "horns&hoofs", "login": ADMIN_LOGIN, "method": "online_score", "token": token,
+            "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"}}
+
+
+def build_request(host, port, body, alive):
+    connection = "keep-alive" if alive else "close"
+    head = (f"POST /method/ HTTP/1.1\r\nHost: {host}:{port}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: {connection}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    status_line, _, raw_headers = head.decode("latin-1").partition("\r\n")
+    headers = {}
+    for line in raw_headers.split("\r\n"):
+        name, _, value = line.partition(":")
+        if value:
+            headers[name.strip().lower()] = value.strip()
+    if "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+        closed = headers.get("connection", "").lower() == "close"
+    else:
+        # HTTPServer отвечает по HTTP/1.0 без Content-Length и закрывает соединение
+        await reader.read()
+        closed = True
+    return int(status_line.split()[1]), closed
+
+
+class LoadState:
+    def __init__(self, requests):
+        self.pending = requests
+        self.latencies = []
+        self.errors = []
+
+
+async def worker(host, port, payload, alive, state):
+    reader = writer = None
+    while state.pending > 0:
+        state.pending -= 1
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(payload)
+            await writer.drain()
+            status, closed = await read_response(reader)
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError) as err:
+            state.errors.append(err)
+            closed = True
+        else:
+            if status == 200:
+                state.latencies.append(time.perf_counter() - started)
+            else:
+                state.errors.append(status)
+        if (closed or not alive) and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+async def run(host, port, requests, concurrency, alive):
+    body = json.dumps(admin_request()).encode("utf-8")
+    payload = build_request(host, port, body, alive)
+    state = LoadState(requests)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(host, port, payload, alive, state) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(state.latencies)
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "keep_alive": alive,
+        "errors": len(state.errors),
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    op = OptionParser(usage="%prog [options] PORT [PORT ...]")
+    op.add_option("--host", action="store", default="localhost")
+    op.add_option("-n", "--requests", action="store", type=int, default=5000)
+    op.add_option("-c", "--concurrency", action="store", type=int, default=50)
+    op.add_option("--no-keepalive", action="store_false", dest="keep_alive", default=True)
+    (opts, args) = op.parse_args()
+    for port in args or ["8080"]:
+        result = asyncio.run(run(opts.host, int(port), opts.requests, opts.concurrency, opts.keep_alive))
+        print(json.dumps({"port": int(port), **result}))
+
+
+if __name__ == "__main__":
+    main()
@@ -33,3 +33,7 @@ def get_interests(store, cid):
     res = store.get(f"i:{cid}")
     # return json.loads(r) if r else []
     return res if res else []
+
+
+def get_interests_many(store, cids):
+    return [res if res else [] for res in store.get_many([f"i:{cid}" for cid in cids])]
@@ -7,6 +7,21 @@ import time
 import redis
 
 DELAY = 0.5
+POOL_OPTIONS = {
+    "max_connections": 50,
+    "health_check_interval": 30,
+    "socket_keepalive": True,
+}
+MGET_CHUNK_SIZE = 500
+
+
+def decode(value):
+    if value is None:
+        return None
+    try:
+        return json.loads(value)
+    except json.decoder.JSONDecodeError:
+        return value.decode() if isinstance(value, bytes) else value
 
 
 def reconnect(num_attempts):
@@ -28,21 +43,26 @@ def reconnect(num_attempts):
 
 class RedisDBStorage:
 
-    def __init__(self, host="localhost", port=6379, timeout=3):
+    def __init__(self, host="localhost", port=6379, timeout=3, pool_options=None):
         self.host = host
         self.port = port
         self.timeout = timeout
+        self.pool_options = {**POOL_OPTIONS, **(pool_options or {})}
+        self.pool = None
         self.server = None
 
     def connect(self):
-        self.server = redis.Redis(
+        self.pool = redis.BlockingConnectionPool(
+            timeout=self.timeout,
             host=self.host,
             port=self.port,
             db=0,
             socket_connect_timeout=self.timeout,
             socket_timeout=self.timeout,
-            decode_responses=True
+            decode_responses=True,
+            **self.pool_options
         )
+        self.server = redis.Redis(connection_pool=self.pool)
 
     def set(self, key, value, expires=None):
         try:
@@ -55,12 +75,31 @@ class RedisDBStorage:
 
     def get(self, key):
         try:
-            value = self.server.get(key)
-            if value is not None:
-                try:
-                    return json.loads(value)
-                except json.decoder.JSONDecodeError:
-                    return value.decode()
+            return decode(self.server.get(key))
+        except redis.exceptions.TimeoutError:
+            logging.error(TimeoutError)
+        except redis.exceptions.ConnectionError as err:
+            raise ConnectionError from err
+        return None
+
+    def set_many(self, mapping, expires=None):
+        try:
+            pipe = self.server.pipeline(transaction=False)
+            for key, value in mapping.items():
+                pipe.set(key, value, ex=expires)
+            return pipe.execute()
+        except redis.exceptions.TimeoutError:
+            logging.error(TimeoutError)
+        except redis.exceptions.ConnectionError as err:
+            raise ConnectionError from err
+        return None
+
+    def get_many(self, keys, chunk_size=MGET_CHUNK_SIZE):
+        values = []
+        try:
+            for start in range(0, len(keys), chunk_size):
+                values.extend(self.server.mget(keys[start:start + chunk_size]))
+            return [decode(value) for value in values]
         except redis.exceptions.TimeoutError:
             logging.error(TimeoutError)
         except redis.exceptions.ConnectionError as err:
@@ -92,6 +131,10 @@ class Store:
     def set(self, key, value):
         return self.storage.set(key, value)
 
+    @reconnect(ATTEMPTS)
+    def set_many(self, mapping):
+        return self.storage.set_many(mapping)
+
     @reconnect(ATTEMPTS)
     def get(self, key, use_cache_if_error=True):
         if use_cache_if_error:
@@ -103,6 +146,23 @@ class Store:
         else:
             return self.storage.get(key)
 
+    def get_many(self, keys, use_cache_if_error=True):
+        # reconnect retries with the same arguments, so a generator of keys is consumed before it
+        return self._get_many(list(keys), use_cache_if_error)
+
+    @reconnect(ATTEMPTS)
+    def _get_many(self, keys, use_cache_if_error):
+        if not use_cache_if_error:
+            return self.storage.get_many(keys)
+        try:
+            values = self.storage.get_many(keys)
+        except redis.exceptions.ConnectionError:
+            logging.error(ConnectionError)
+            values = None
+        if values is None:
+            return [self.cache_get(key) for key in keys]
+        return values
+
     @reconnect(ATTEMPTS)
     def delete(self, key):
         return self.storage.delete(key)
@@ -0,0 +1,30 @@
+# pylint: disable=C0114,C0115,C0116,C0301
+import asyncio
+import threading
+
+import api
+import loadtest
+
+
+def test_threaded_server(monkeypatch):
+    monkeypatch.setattr(api.MainHTTPHandler, "store", None)
+    server = api.make_server(0, threads=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        result = asyncio.run(loadtest.run("localhost", server.server_address[1], 50, 10, True))
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert isinstance(server, api.ThreadingHTTPServer)
+    assert result["errors"] == 0
+
+
+def test_reuse_port():
+    first = api.make_server(0, reuse_port=True)
+    second = api.make_server(first.server_address[1], reuse_port=True)
+    try:
+        assert second.server_address == first.server_address
+    finally:
+        first.server_close()
+        second.server_close()
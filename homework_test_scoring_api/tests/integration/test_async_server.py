@@ -0,0 +1,110 @@
+# pylint: disable=C0114,C0115,C0116,C0301
+import asyncio
+import json
+import socket
+
+from fakeredis import FakeRedis
+
+import async_server
+import loadtest
+from async_server import AsyncScoringServer
+from store import Store, RedisDBStorage
+
+
+def make_store():
+    store = Store(RedisDBStorage())
+    store.storage.server = FakeRedis(decode_responses=True)
+    store.set('i:1', json.dumps(["books", "tv"]))
+    return store
+
+
+async def request(reader, writer, body, connection="keep-alive"):
+    writer.write(loadtest.build_request("localhost", 0, json.dumps(body).encode("utf-8"), connection == "keep-alive"))
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+    return head.decode("latin-1"), json.loads(await reader.readexactly(length))
+
+
+async def keep_alive_session():
+    server = AsyncScoringServer(make_store(), port=0)
+    await server.start()
+    try:
+        reader, writer = await asyncio.open_connection("localhost", server.port)
+        head, score = await request(reader, writer, loadtest.admin_request())
+        assert head.startswith("HTTP/1.1 200 OK")
+        assert "Connection: keep-alive" in head
+        interests = dict(loadtest.admin_request(), method="clients_interests",
+                         arguments={"client_ids": [1, 2], "date": "20.07.2017"})
+        _, interests = await request(reader, writer, interests)
+        head, forbidden = await request(reader, writer, dict(loadtest.admin_request(), token="bad"), "close")
+        assert "Connection: close" in head
+        assert await reader.read() == b""
+        writer.close()
+        return score, interests, forbidden
+    finally:
+        await server.close()
+
+
+def test_keep_alive():
+    score, interests, forbidden = asyncio.run(keep_alive_session())
+    assert score == {"response": {"score": 42}, "code": 200}
+    assert interests == {"response": {"client_id1": ["books", "tv"], "client_id2": []}, "code": 200}
+    assert forbidden["code"] == 403
+
+
+def test_loadtest():
+    async def session():
+        server = AsyncScoringServer(make_store(), port=0)
+        await server.start()
+        try:
+            return await loadtest.run("localhost", server.port, 50, 10, True)
+        finally:
+            await server.close()
+
+    result = asyncio.run(session())
+    assert result["errors"] == 0
+    assert result["rps"] > 0
+
+
+def test_loadtest_errors():
+    async def session():
+        server = AsyncScoringServer(make_store(), port=0, router={})
+        await server.start()
+        try:
+            return await loadtest.run("localhost", server.port, 5, 2, True)
+        finally:
+            await server.close()
+
+    result = asyncio.run(session())
+    assert (result["errors"], result["rps"]) == (5, 0)
+
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        port = sock.getsockname()[1]
+    result = asyncio.run(loadtest.run("localhost", port, 3, 1, True))
+    assert (result["errors"], result["rps"]) == (3, 0)
+
+
+def test_body_limits(monkeypatch):
+    monkeypatch.setattr(async_server, "KEEPALIVE_TIMEOUT", 0.2)
+
+    async def session():
+        server = AsyncScoringServer(make_store(), port=0)
+        await server.start()
+        try:
+            reader, writer = await asyncio.open_connection("localhost", server.port)
+            writer.write(b"POST /method/ HTTP/1.1\r\nContent-Length: %d\r\n\r\n{" % (async_server.MAX_BODY_SIZE + 1))
+            too_large = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            reader, writer = await asyncio.open_connection("localhost", server.port)
+            writer.write(b"POST /method/ HTTP/1.1\r\nContent-Length: 100\r\n\r\n{")
+            slow = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            return too_large, slow
+        finally:
+            await server.close()
+
+    too_large, slow = asyncio.run(session())
+    assert too_large.startswith(b"HTTP/1.1 413 Request Entity Too Large")
+    assert slow == b""
@@ -1,7 +1,9 @@
 # pylint: disable=C0114,C0115,C0116,C0301,W0621
+import redis
 from fakeredis import FakeServer, FakeRedis
 from pytest import fixture, raises
 
+from scoring import get_interests_many
 from store import Store, RedisDBStorage
 
 
@@ -53,3 +55,63 @@ def test_connection_ok(setup):
     store, server = setup
     server.connected = True
     assert store.get('spam') == 'eggs'
+
+
+def test_set_get_many(setup):
+    store, server = setup
+    server.connected = True
+    assert store.set_many({'i:1': '["books", "tv"]', 'i:2': 'cars'}) == [True, True]
+    assert store.storage.get_many(['i:1', 'hello', 'i:3', 'i:2']) == [["books", "tv"], 'world', None, 'cars']
+    server.connected = False
+    with raises(ConnectionError):
+        store.set_many({'foo': 'bar'})
+
+
+def test_connection_pool():
+    storage = RedisDBStorage(pool_options={"max_connections": 4, "health_check_interval": 10})
+    storage.connect()
+    assert storage.pool.max_connections == 4
+    assert storage.pool.connection_kwargs['health_check_interval'] == 10
+    assert storage.pool.connection_kwargs['socket_keepalive'] is True
+
+
+def test_get_many(setup, monkeypatch):
+    store, server = setup
+    server.connected = True
+    calls = []
+    mget = store.storage.server.mget
+    monkeypatch.setattr(store.storage.server, 'mget', lambda keys: calls.append(keys) or mget(keys))
+    assert store.storage.get_many(['hello', 'scramble', 'spam'], chunk_size=2) == ['world', None, 'eggs']
+    assert calls == [['hello', 'scramble'], ['spam']]
+
+
+def test_get_many_fallback(setup, monkeypatch):
+    store, server = setup
+    server.connected = True
+
+    def timeout(keys):
+        raise redis.exceptions.TimeoutError
+
+    monkeypatch.setattr(store.storage.server, 'mget', timeout)
+    assert store.get_many(iter(['hello', 'scramble'])) == ['world', None]
+
+
+def test_get_many_retry(setup, monkeypatch):
+    store, server = setup
+    server.connected = True
+    store.set('i:1', '["books", "tv"]')
+    mget = store.storage.server.mget
+    calls = []
+
+    def flaky(keys):
+        calls.append(keys)
+        if len(calls) == 1:
+            raise redis.exceptions.ConnectionError
+        return mget(keys)
+
+    monkeypatch.setattr(store.storage.server, 'mget', flaky)
+    assert get_interests_many(store, [1, 2]) == [["books", "tv"], []]
+    assert calls == [['i:1', 'i:2'], ['i:1', 'i:2']]
+    calls.clear()
+    assert store.get_many(f'i:{cid}' for cid in (1, 2)) == [["books", "tv"], None]
+    assert len(calls) == 2